@@ -0,0 +1,184 @@
+import sqlite3 as db
+from contextlib import contextmanager
+from os import environ, path, mkdir
+from threading import local, Lock
+from migrations import migrate
+
+DIRECTORY = environ["USERPROFILE"] + "\\.tickets"
+if not path.exists(DIRECTORY):
+    mkdir(DIRECTORY)
+
+DB_FILE = DIRECTORY + "\\records.db"
+STATEMENT_CACHE_SIZE = 256 # Prepared statements kept per connection
+CACHE_SIZE_KIB = 16384 # Page cache of each connection (16 MiB)
+MMAP_SIZE = 256 * 1024 * 1024 # Memory mapped I/O (256 MiB)
+BUSY_TIMEOUT_MS = 5000 # Time to wait for a lock before failing
+
+# Durability tiers -> 'synchronous' setting. With WAL, 'normal' never
+# corrupts the database, but the last commits may be lost on a power failure.
+DURABILITY_LEVELS = {"safe": "FULL",
+                     "normal": "NORMAL",
+                     "fast": "OFF"}
+
+
+class Database():
+    """
+    Connection manager for the records database. Each thread gets its own
+    long-lived connection the first time it uses the database, so the GUI
+    thread and any background thread share a small pool of connections which
+    stay open until 'close' is called. Every connection keeps a cache of
+    prepared statements, and runs in autocommit mode unless a 'transaction'
+    is open.
+    
+    The connections use the storage profile set by '_configure': WAL
+    journaling (so readers don't block the writer), a sized page cache, memory
+    mapped I/O and in-memory temporary tables. The 'synchronous' setting
+    depends on the chosen durability tier (see DURABILITY_LEVELS).
+    
+    The first connection brings the database schema up to date (see the
+    'migrations' module).
+    """
+    def __init__(self, db_file:str=DB_FILE, durability:str="normal") -> None:
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability level: {durability}")
+        self.db_file = db_file
+        self.durability = durability
+        self._local = local()
+        self._connections = []
+        self._lock = Lock()
+        self._migrated = False
+
+    @property
+    def connection(self) -> db.Connection:
+        """Connection of the current thread, opened on first use.
+
+        Returns:
+            db.Connection: Connection to the database
+        """
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = db.connect(self.db_file, isolation_level=None,
+                              cached_statements=STATEMENT_CACHE_SIZE,
+                              check_same_thread=False)
+            self._configure(conn)
+            self._local.connection = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+                if not self._migrated:
+                    migrate(conn)
+                    self._migrated = True
+        return conn
+
+    def _configure(self, conn:db.Connection) -> None:
+        """Applies the storage profile to a new connection.
+
+        Args:
+            conn (db.Connection): Connection to configure
+        """
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={DURABILITY_LEVELS[self.durability]}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+
+    def set_durability(self, durability:str) -> None:
+        """Changes the durability tier of all the connections.
+
+        Args:
+            durability (str): One of 'safe', 'normal' or 'fast'
+
+        Raises:
+            ValueError: If the durability tier doesn't exist
+        """
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability level: {durability}")
+        self.durability = durability
+        with self._lock:
+            for conn in self._connections:
+                conn.execute(f"PRAGMA synchronous={DURABILITY_LEVELS[durability]}")
+
+    def execute(self, sql:str, parameters=()) -> db.Cursor:
+        """Executes a statement on the connection of the current thread.
+
+        Args:
+            sql (str): SQL statement
+            parameters (Sequence | dict, optional): Statement parameters.
+                Defaults to ().
+
+        Returns:
+            db.Cursor: Cursor with the results
+        """
+        return self.connection.execute(sql, parameters)
+
+    def executemany(self, sql:str, seq_of_parameters) -> db.Cursor:
+        """Executes a statement once for each set of parameters on the
+        connection of the current thread.
+
+        Args:
+            sql (str): SQL statement
+            seq_of_parameters (Iterable): Parameters for each execution
+
+        Returns:
+            db.Cursor: Cursor used for the executions
+        """
+        return self.connection.executemany(sql, seq_of_parameters)
+
+    @contextmanager
+    def transaction(self):
+        """Context manager which runs the enclosed statements in a single
+        transaction, committed on exit or rolled back if an exception is
+        raised. Nested transactions become savepoints of the outer one.
+
+        Yields:
+            db.Connection: Connection of the current thread
+        """
+        conn = self.connection
+        depth = self._local.depth
+        conn.execute(f"SAVEPOINT level_{depth}" if depth else "BEGIN")
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            if depth:
+                conn.execute(f"ROLLBACK TO level_{depth}")
+                conn.execute(f"RELEASE level_{depth}")
+            else:
+                conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute(f"RELEASE level_{depth}" if depth else "COMMIT")
+        finally:
+            self._local.depth -= 1
+
+    def close(self) -> None:
+        """
+        Closes the connections of all the threads.
+        """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = local()
+
+
+_databases = {}
+_databases_lock = Lock()
+
+def get_database(db_file:str=DB_FILE, durability:str="normal") -> Database:
+    """Returns the shared connection manager of the given database file,
+    creating it on first use.
+
+    Args:
+        db_file (str, optional): Database file. Defaults to DB_FILE.
+        durability (str, optional): Durability tier used when the manager is
+            created. Defaults to "normal".
+
+    Returns:
+        Database: Shared connection manager
+    """
+    with _databases_lock:
+        if db_file not in _databases:
+            _databases[db_file] = Database(db_file, durability)
+        return _databases[db_file]
@@ -1,121 +1,340 @@
-import pandas as pd
-from os import environ, path, mkdir
+import numpy as np
+import csv
+import os
+from contextlib import contextmanager
+from os import path, mkdir
 from fpdf import FPDF
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 from time import strftime
-import sqlite3 as db
+from database import get_database, DIRECTORY as DATABASE_DIRECTORY
+from tickets import Tickets, COLUMNS, format_cents
 
-DIRECTORY = environ["USERPROFILE"] + "\\.tickets\\exports"
+DIRECTORY = DATABASE_DIRECTORY + "\\exports"
+MONEY_FORMAT = "0.00" # Number format of the money columns in xlsx files
+PDF_FONT = "times"
+PDF_FONT_SIZE = 10
+PDF_COLUMN_WIDTH = 37
+PDF_ROW_HEIGHT = 10
+PROGRESS_CHUNK = 4096 # Tickets written between the progress steps of an export
+# Export method and extension of each file type
+FILE_TYPES = {"CSV": ("to_csv", ".csv"),
+              "EXCEL": ("to_excel", ".xlsx"),
+              "PDF": ("to_pdf", ".pdf")}
 if not path.exists(DIRECTORY):
     mkdir(DIRECTORY)
     
 
+@contextmanager
+def replacing_file(file:str):
+    """Context manager which yields a temporary file, in the same directory
+    as the given one, to be written instead of it. The temporary file
+    replaces the given one once the enclosed block is done, if it raises
+    only the temporary file is removed, so an existing file is never lost
+    by a failed or cancelled export.
+
+    Args:
+        file (str): File to be written
+
+    Yields:
+        str: Temporary file
+    """
+    temporary_file = file + ".tmp"
+    try:
+        yield temporary_file
+    except BaseException:
+        if path.exists(temporary_file):
+            os.remove(temporary_file)
+        raise
+    os.replace(temporary_file, file)
+
+
+class PdfBuffer():
+    """
+    Replacement of the in-memory document of FPDF, which is a string grown
+    one line at a time. Its parts are kept in a list and joined once, when
+    the document is written, so the cost of writing a document doesn't grow
+    with the square of its pages.
+    """
+    def __init__(self) -> None:
+        self.parts = []
+        self.length = 0
+        
+    def __iadd__(self, part:str) -> "PdfBuffer":
+        self.parts.append(part)
+        self.length += len(part)
+        return self
+    
+    def __len__(self) -> int:
+        return self.length
+    
+    def encode(self, encoding:str) -> bytes:
+        """Encodes the whole document.
+
+        Args:
+            encoding (str): Encoding of the document
+
+        Returns:
+            bytes: Encoded document
+        """
+        return "".join(self.parts).encode(encoding)
+        
+        
+class ExportCancelled(Exception):
+    """
+    Raised by the progress callback of an export to stop it.
+    """
+
+
 class Export():
     def __init__(self):
         self.path = DIRECTORY
-        self.create_path_table()
+        self.db = get_database()
         self.load_export_path()
         
-    def to_csv(self, data:pd.DataFrame, path:str, file_name:str) -> None:
-        """Exports the given data (tickets) with the given name into the given
+    def export(self, tickets:Tickets, file_type:str, path:str, file_name:str,
+               progress=None) -> str:
+        """Exports the given tickets with the given name into the given
+        directory, as a file of the given type. The file is only replaced
+        once it's completely written (see 'replacing_file'), so a failed or
+        cancelled export (see 'ExportCancelled') leaves the directory as it
+        was.
+
+        Args:
+            tickets (Tickets): Tickets to be exported
+            file_type (str): Type of the file, one of FILE_TYPES
+            path (str): Directory where the file will be saved
+            file_name (str): Name of the file to export
+            progress (Callable, optional): Called with the number of tickets
+                written and the total as the file is written, it may raise
+                to stop the export. Defaults to None.
+
+        Returns:
+            str: Path of the exported file
+        """
+        method, extension = FILE_TYPES[file_type]
+        getattr(self, method)(tickets, path, file_name, progress)
+        return path + "\\" + file_name + extension
+        
+    def to_csv(self, tickets:Tickets, path:str, file_name:str,
+               progress=None) -> None:
+        """Exports the given tickets with the given name into the given
         directory as a csv file. Also adds a a row at the end with the summary
-        of the data.
+        of the data, taken from the running totals. The rows are written in
+        chunks straight from the tickets column arrays, so the memory used
+        doesn't grow with the number of tickets.
 
         Args:
-            data (pd.DataFrame): Data to be exported
+            tickets (Tickets): Tickets to be exported
             path (str): Directory where the file will be saved
             file_name (str): Name of the file to export
+            progress (Callable, optional): Called with the number of tickets
+                written and the total after each chunk. Defaults to None.
         """
-        data_to_export = self.prepare_data(data)
-        data_to_export.to_csv(path + "\\" + file_name + ".csv", index=False)
+        with replacing_file(path + "\\" + file_name + ".csv") as temporary_file, \
+            open(temporary_file, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNS)
+            for ids, names, *amounts in tickets.iter_chunks(PROGRESS_CHUNK):
+                writer.writerows(zip(ids.tolist(), names.tolist(),
+                                     *(map(format_cents, column.tolist())
+                                       for column in amounts)))
+                if progress is not None:
+                    progress(int(ids[-1]), len(tickets))
+            writer.writerow(("", "TOTAL", *map(format_cents,
+                                               tickets.summary_cents)))
         
-    def to_excel(self, data:pd.DataFrame, path:str, file_name:str) -> None:
-        """Exports the given data (tickets) with the given name into the given
+    def to_excel(self, tickets:Tickets, path:str, file_name:str,
+                 progress=None) -> None:
+        """Exports the given tickets with the given name into the given
         directory as a xlsx file. Also adds a a row at the end with the summary
-        of the data.
+        of the data, as SUM formulas of the money columns. The workbook is
+        written in write-only mode, the rows are streamed to the file in
+        chunks straight from the tickets column arrays. The money cells are
+        reused for every row, so their number format is only styled once.
 
         Args:
-            data (pd.DataFrame): Data to be exported
+            tickets (Tickets): Tickets to be exported
             path (str): Directory where the file will be saved
             file_name (str): Name of the file to export
+            progress (Callable, optional): Called with the number of tickets
+                written and the total after each chunk. Defaults to None.
         """
-        data_to_export = self.prepare_data(data)
-        data_to_export.to_excel(path + "\\" + file_name + ".xlsx", index=False)
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Sheet1")
+        bold = Font(bold=True)
+        header = [WriteOnlyCell(sheet, column) for column in COLUMNS]
+        for cell in header:
+            cell.font = bold
+        sheet.append(header)
+        money = [WriteOnlyCell(sheet) for _ in range(3)]
+        for cell in money:
+            cell.number_format = MONEY_FORMAT
+        try:
+            for ids, names, *amounts in tickets.iter_chunks(PROGRESS_CHUNK):
+                for ticket_id, name, *values in zip(ids.tolist(), names.tolist(),
+                                                    *((column / 100).tolist()
+                                                      for column in amounts)):
+                    for cell, value in zip(money, values):
+                        cell.value = value
+                    sheet.append((ticket_id, name, *money))
+                if progress is not None:
+                    progress(int(ids[-1]), len(tickets))
+        except BaseException:
+            sheet.close() # Closes the stream of rows of the stopped export
+            raise
+        last_row = len(tickets) + 1
+        summary = [WriteOnlyCell(sheet, f"=SUM({column}2:{column}{last_row})")
+                   for column in "CDE"]
+        for cell in summary:
+            cell.number_format = MONEY_FORMAT
+            cell.font = bold
+        sheet.append((None, WriteOnlyCell(sheet, "TOTAL"), *summary))
+        with replacing_file(path + "\\" + file_name + ".xlsx") as temporary_file:
+            workbook.save(temporary_file)
         
-    def to_pdf(self, data:pd.DataFrame, path:str, file_name:str) -> None:
-        """Exports the given data (tickets) with the given name into the given
+    def to_pdf(self, tickets:Tickets, path:str, file_name:str,
+               progress=None) -> None:
+        """Exports the given tickets with the given name into the given
         directory as a pdf file. Also adds a a row at the end with the summary
         of the data, and the date and name of the file on top.
+        The table is rendered page by page: the cells are formatted by column
+        (see 'pdf_columns'), the rows of each page are computed up front (see
+        'pdf_pages') and the header is repeated on top of every page.
 
         Args:
-            data (pd.DataFrame): Data to be exported
+            tickets (Tickets): Tickets to be exported
             path (str): Directory where the file will be saved
             file_name (str): Name of the file to export
+            progress (Callable, optional): Called with the number of tickets
+                written and the total as the table is formatted and drawn.
+                Defaults to None.
         """
-        data_to_export = self.prepare_data(data)
+        def table_progress(done:int, drawing:bool) -> None:
+            # Formatting the cells is the first half of the work
+            if progress is not None:
+                progress((done + len(tickets) * drawing) // 2, len(tickets))
         pdf = FPDF()
+        pdf.buffer = PdfBuffer()
+        pdf.set_auto_page_break(False, pdf.b_margin)
         pdf.add_page()
         
         #Add date and name to pdf
         pdf.ln(10)
-        pdf.set_font("times", "B", 18)
-        pdf.cell(0, 5, f"Fecha: {strftime("%d/%m/%Y")}", 0, 1, "R")
+        pdf.set_font(PDF_FONT, "B", 18)
+        pdf.cell(0, 5, "Fecha: " + strftime("%d/%m/%Y"), 0, 1, "R")
         pdf.ln(5)
         pdf.cell(0,15, file_name, 0, 2, "L")
         pdf.ln(10)
         
-        #Add column headers to the table in the pdf
-        pdf.set_font("times", "B", 10)
-        columns = data_to_export.columns
-        for column in columns:
-            pdf.cell(37, 10, column, 1, 0, "C")
-
-        #Fill table in pdf with tickets data
-        pdf.set_font("times", "", 10)
-        for index, row in data_to_export.iterrows():
-            pdf.ln(10)
-            pdf.cell(37, 10, str(row["ID"]), 1, 0, "C")
-            pdf.cell(37, 10, str(row["Ticket"]), 1, 0, "C")
-            pdf.cell(37, 10, str(row["Total"]), 1, 0, "C")
-            pdf.cell(37, 10, str(row["Sub-Total"]), 1, 0, "C")
-            pdf.cell(37, 10, str(row["IVA"]), 1, 0, "C")
+        #Fill the table page by page, the summary row is the last one
+        pdf.set_font(PDF_FONT, "", PDF_FONT_SIZE)
+        columns = self.pdf_columns(pdf, tickets,
+                                   lambda done, total: table_progress(done, False))
+        for start, end, top in self.pdf_pages(pdf, len(columns[0][0])):
+            if start:
+                pdf.add_page()
+            pdf.set_xy(pdf.l_margin, top)
+            pdf.set_font(PDF_FONT, "B", PDF_FONT_SIZE)
+            for column in COLUMNS:
+                pdf.cell(PDF_COLUMN_WIDTH, PDF_ROW_HEIGHT, column, 1, 0, "C")
+            pdf.set_font(PDF_FONT, "", PDF_FONT_SIZE)
+            self.pdf_rows(pdf, columns, start, end, top + PDF_ROW_HEIGHT)
+            table_progress(min(end, len(tickets)), True)
             
-        pdf.output(path + "\\" + file_name + ".pdf")
+        with replacing_file(path + "\\" + file_name + ".pdf") as temporary_file:
+            pdf.output(temporary_file)
         
-    def prepare_data(self, data:pd.DataFrame) -> pd.DataFrame:
-        """Prepares the data (tickets) to be exported, adding a new row with 
-        the summary of the tickets.
+    def pdf_columns(self, pdf:FPDF, tickets:Tickets, progress=None) -> list:
+        """Formats the cells of the pdf table by column, with the summary row
+        at the end, along with the offset which centers each text in its
+        cell (measured with the current font). The tickets are formatted in
+        chunks.
 
         Args:
-            data (pd.DataFrame): Data to be prepared
+            pdf (FPDF): Document, with the font of the table set
+            tickets (Tickets): Tickets to be exported
+            progress (Callable, optional): Called with the number of tickets
+                formatted and the total after each chunk. Defaults to None.
 
         Returns:
-            pd.DataFrame: Prepared Data
+            list: Escaped texts and offsets (np.ndarray) of each column
         """
-        summary = data.sum()
-        summary["ID"] = ""
-        summary["Ticket"] = "TOTAL"
-        summary["Total"] = round(summary["Total"], 2)
-        summary["Sub-Total"] = round(summary["Sub-Total"], 2)
-        summary["IVA"] = round(summary["IVA"], 2)
-        summary = summary.to_frame().T
-        prepared_data = pd.concat([data, summary])
-        return prepared_data
-    
-    def create_path_table(self) -> None:
-        """Creates the 'export_path' table into the 'records' database and
-        set the path to 'USERPROFILE\\.tickets\\exports' as the default directory.
+        char_widths = pdf.current_font["cw"]
+        def format_cells(texts:np.ndarray) -> tuple:
+            # Escaped texts and centering offsets of a column chunk
+            widths = np.zeros(len(texts))
+            for char in set("".join(texts.tolist())):
+                widths += np.char.count(texts, char) * char_widths.get(char, 0)
+            offsets = (PDF_COLUMN_WIDTH - widths * pdf.font_size / 1000) / 2
+            for char in ("\\", "(", ")"): # Escape the pdf strings
+                texts = np.char.replace(texts, char, "\\" + char)
+            return texts, offsets
+        chunks = []
+        for ids, names, *amounts in tickets.iter_chunks(PROGRESS_CHUNK):
+            chunks.append([format_cells(column) for column in
+                           (ids.astype(str), names.astype(str),
+                            *map(format_cents, amounts))])
+            if progress is not None:
+                progress(int(ids[-1]), len(tickets))
+        summary = ("", "TOTAL", *map(format_cents, tickets.summary_cents))
+        chunks.append([format_cells(np.array([text])) for text in summary])
+        return [tuple(map(np.concatenate, zip(*column))) for column in zip(*chunks)]
+        
+    def pdf_pages(self, pdf:FPDF, rows:int) -> list:
+        """Computes the rows of the table which fit in each page, below the
+        header of the table. The first page starts at the current position.
+
+        Args:
+            pdf (FPDF): Document
+            rows (int): Rows of the table, including the summary
+
+        Returns:
+            list: First row, end row and top position of each page
         """
-        self.db_file = environ["USERPROFILE"] + "\\.tickets\\records.db"
-        conn = db.connect(self.db_file)
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM sqlite_master WHERE name=='export_path'")
-        if cur.fetchone() is None:
-            cur.execute("CREATE TABLE export_path (ID INTEGER PRIMARY KEY," \
-                        "Path TEXT)")
-            cur.execute("INSERT INTO export_path(Path) VALUES(?)", (self.path,))
-            conn.commit()
-        cur.close()
-        conn.close()
+        pages, start, top = [], 0, pdf.get_y()
+        bottom = pdf.h - pdf.b_margin
+        while start < rows:
+            fit = max(int((bottom - top) // PDF_ROW_HEIGHT) - 1, 1)
+            pages.append((start, min(start + fit, rows), top))
+            start, top = start + fit, pdf.t_margin
+        return pages
+        
+    def pdf_rows(self, pdf:FPDF, columns:list, start:int, end:int,
+                 top:float) -> None:
+        """Draws the given rows of the table in the current page, as a single
+        block of pdf operators: the grid lines and the centered texts, row
+        by row so the text keeps the reading order of the table.
+
+        Args:
+            pdf (FPDF): Document
+            columns (list): Texts and offsets of each column (see 'pdf_columns')
+            start (int): First row
+            end (int): End row (not included)
+            top (float): Top position of the first row
+        """
+        k, height, left = pdf.k, pdf.h, pdf.l_margin
+        right = left + PDF_COLUMN_WIDTH * len(columns)
+        bottom = top + PDF_ROW_HEIGHT * (end - start)
+        operators = []
+        for line in range(end - start + 1):
+            y = (height - top - line * PDF_ROW_HEIGHT) * k
+            operators.append(f"{left * k:.2f} {y:.2f} m {right * k:.2f} {y:.2f} l S")
+        for line in range(len(columns) + 1):
+            x = (left + line * PDF_COLUMN_WIDTH) * k
+            operators.append(f"{x:.2f} {(height - top) * k:.2f} m "\
+                             f"{x:.2f} {(height - bottom) * k:.2f} l S")
+        baselines = (height - top - 0.5 * PDF_ROW_HEIGHT - 0.3 * pdf.font_size -
+                     np.arange(end - start) * PDF_ROW_HEIGHT) * k
+        cells = []
+        for index, (texts, offsets) in enumerate(columns):
+            xs = (left + index * PDF_COLUMN_WIDTH + offsets[start:end]) * k
+            cells.append([f"BT {x:.2f} {y:.2f} Td ({text}) Tj ET"
+                          for x, y, text in zip(xs.tolist(), baselines.tolist(),
+                                                texts[start:end].tolist())])
+        operators.extend(cell for row in zip(*cells) for cell in row)
+        pdf._out("\n".join(operators))
         
     def change_export_path(self, new_path:str) -> None:
         """Changes the export path to the given one, updating the 'export_path'
@@ -124,22 +343,34 @@ class Export():
         Args:
             new_path (str): New exports directory
         """
-        conn = db.connect(self.db_file)
-        cur = conn.cursor()
-        cur.execute("UPDATE export_path SET Path=? WHERE ID==1", (new_path,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        self.db.execute("UPDATE export_path SET Path=? WHERE ID==1", (new_path,))
         self.path = new_path
         
     def load_export_path(self) -> None:
         """
         Loads the registered export path from the database into the path 
-        variable.
+        variable. The first time, 'USERPROFILE\\.tickets\\exports' is 
+        registered as the default directory.
         """
-        conn = db.connect(self.db_file)
-        cur = conn.cursor()
-        cur.execute("SELECT Path FROM export_path WHERE ID==1")
-        self.path = cur.fetchone()[0]
-        cur.close()
-        conn.close()
\ No newline at end of file
+        cur = self.db.execute("SELECT Path FROM export_path WHERE ID==1")
+        row = cur.fetchone()
+        if row is None:
+            self.db.execute("INSERT INTO export_path(ID, Path) VALUES(1, ?)",
+                            (DIRECTORY,))
+        else:
+            self.path = row[0]
+
+def export_record(record_name:str, file_type:str, path:str) -> None:
+    """Exports the tickets of a saved record into the given directory, the
+    file is named after the record. It runs in the processes of the batch
+    exports (see 'workers.BatchExport'), each process reads the record with
+    its own connection to the database.
+
+    Args:
+        record_name (str): Name of the record
+        file_type (str): Type of the file, one of FILE_TYPES
+        path (str): Directory where the file will be saved
+    """
+    tickets = Tickets()
+    tickets.fetch_record(record_name)
+    Export().export(tickets, file_type, path, record_name)
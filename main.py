@@ -1,15 +1,19 @@
-from PySide6.QtWidgets import QMainWindow, QApplication, QTableWidget, \
-    QAbstractItemView, QToolBar, QTableWidgetItem, QDialog, QLabel, \
+from PySide6.QtWidgets import QMainWindow, QApplication, QTableView, \
+    QAbstractItemView, QToolBar, QDialog, QLabel, \
     QGridLayout, QPushButton, QLineEdit, QSpacerItem, QMessageBox, \
-    QFileDialog, QComboBox
+    QFileDialog, QComboBox, QWidgetAction, QProgressBar, QDateEdit
 from PySide6.QtGui import QIcon, QAction, QRegularExpressionValidator, \
     QDesktopServices
-from PySide6.QtCore import Qt, QUrl
+from PySide6.QtCore import Qt, QUrl, QTimer, QDate
 from PySide6.QtPdfWidgets import QPdfView
 from PySide6.QtPdf import QPdfDocument
-from tickets import Tickets
+from tickets import Tickets, format_cents, parse_amount
 from export import Export
 from records import Records
+from database import get_database
+from models import TicketsModel, RecordsModel
+from workers import DatabaseQueue, BatchExport, ExportJob
+from multiprocessing import freeze_support
 from sys import argv, exit
 import resources_rc
 
@@ -26,6 +30,10 @@ class MainWindow(QMainWindow):
         self.export = Export()
         self.tickets = Tickets()
         self.records = Records()
+        self.database_queue = DatabaseQueue(self)
+        self.export_job = None
+        self.tickets_model = TicketsModel(self.tickets)
+        self.records_model = RecordsModel(self.records, self.database_queue)
         
         # Validator to decimal number and text inputs
         self.float_validator = QRegularExpressionValidator("^\\d+(\\.\\d+)?$")
@@ -47,11 +55,11 @@ class MainWindow(QMainWindow):
         self.add_tickets_action.triggered.connect(self.add_tickets)
         
         self.remove_ticket_action = QAction(QIcon(":/remove.png"),
-                                            "Eliminar ticket", self)
+                                            "Eliminar tickets", self)
         self.remove_ticket_action.triggered.connect(self.remove_ticket)
         
         self.edit_ticket_action = QAction(QIcon(":/edit.png"),
-                                          "Editar ticket", self)
+                                          "Editar tickets", self)
         self.edit_ticket_action.triggered.connect(self.edit_ticket)
         
         self.export_tickets_action = QAction(QIcon(":/export.png"),
@@ -82,6 +90,13 @@ class MainWindow(QMainWindow):
                                           "Abrir registro", self)
         self.open_record_action.triggered.connect(self.open_record)
         
+        self.export_records_action = QAction(QIcon(":/export.png"),
+                                             "Exportar registros", self)
+        self.export_records_action.triggered.connect(self.export_records)
+        
+        self.verify_records_action = QAction("Verificar totales", self)
+        self.verify_records_action.triggered.connect(self.verify_records)
+        
         self.save_record_action = QAction(QIcon(":/save.png"),
                                           "Guardar registro", self)
         self.save_record_action.triggered.connect(self.save_record)
@@ -94,6 +109,33 @@ class MainWindow(QMainWindow):
         self.repo_help_action.triggered.connect(self.open_github_repo)
         
         self.blushed_help_action = QAction("BlushedNanis", self)
+        
+        # --> Records search box, the search runs once the user stops typing
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Buscar registros o tickets")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setMinimumWidth(250)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.search_records)
+        self.search_box.textChanged.connect(self.search_timer.start)
+        self.search_records_action = QWidgetAction(self)
+        self.search_records_action.setDefaultWidget(self.search_box)
+
+        # Actions disabled while the database thread is busy
+        self.storage_actions = (self.add_tickets_action,
+                                self.remove_ticket_action,
+                                self.edit_ticket_action,
+                                self.export_tickets_action,
+                                self.clear_tickets_action,
+                                self.view_records_action,
+                                self.new_record_action,
+                                self.remove_record_action,
+                                self.open_record_action,
+                                self.export_records_action,
+                                self.save_record_action,
+                                self.verify_records_action)
 
         # Toolbar
         self.tool_bar = QToolBar()
@@ -103,9 +145,34 @@ class MainWindow(QMainWindow):
         self.addToolBar(Qt.BottomToolBarArea,self.tool_bar)
         
         # Table (Central Widget) config
-        self.table = QTableWidget()
+        self.table = QTableView()
         self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.setCentralWidget(self.table)
+        
+        # Status bar, busy indicator of the database thread
+        self.busy_label = QLabel()
+        self.busy_bar = QProgressBar()
+        self.busy_bar.setRange(0, 0)
+        self.busy_bar.setMaximumWidth(120)
+        self.busy_bar.hide()
+        self.statusBar().addPermanentWidget(self.busy_label)
+        self.statusBar().addPermanentWidget(self.busy_bar)
+        self.database_queue.busy_changed.connect(self.set_busy)
+        self.database_queue.failed.connect(self.database_error)
+        
+        # Status bar, progress of the running export
+        self.export_label = QLabel()
+        self.export_bar = QProgressBar()
+        self.export_bar.setMaximumWidth(120)
+        self.export_cancel_button = QPushButton("Cancelar")
+        self.export_cancel_button.clicked.connect(self.cancel_export)
+        for widget in (self.export_label, self.export_bar,
+                       self.export_cancel_button):
+            widget.hide()
+            self.statusBar().addPermanentWidget(widget)
+        
         self.show_tickets_window() # Show the tickets window by default
         
     def show_tickets_window(self):
@@ -116,11 +183,7 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Sistema de tickets")
         self.resize(600, 600)
         self.menuBar().show()
-        self.table.clear()
-        self.table.setRowCount(0)
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(("ID", "Ticket", "Total", 
-                                              "Sub-Total", "IVA"))
+        self.table.setModel(self.tickets_model)
         self.table.verticalHeader().setVisible(False)
         self.table.doubleClicked.disconnect()
         self.table.doubleClicked.connect(self.edit_ticket)
@@ -186,17 +249,16 @@ class MainWindow(QMainWindow):
         """
         self.setWindowTitle("Explorador de registros")
         self.resize(900,600)
-        self.tickets.clear_data()
+        self.tickets_model.clear()
         self.table.doubleClicked.disconnect()
         self.table.doubleClicked.connect(self.open_record)
-        self.table.clear()
-        self.table.setColumnCount(8)
-        self.table.setHorizontalHeaderLabels(("ID", "Registro", "Fecha de guardado", 
-                                              "Fecha de modificacion", "Tickets",
-                                              "Total", "Sub-Total", "IVA"))
+        self.table.setModel(self.records_model)
         self.table.verticalHeader().setVisible(False)
         #self.table.doubleClicked.connect(self.edit_ticket)
-        self.load_records()
+        self.search_box.blockSignals(True)
+        self.search_box.clear()
+        self.search_box.blockSignals(False)
+        self.records_model.set_search("")
         # Set custom columns width
         col_widths = (30,250,120,130,70,70,70,70)
         for col, width in zip(range(0,8), col_widths):
@@ -212,6 +274,10 @@ class MainWindow(QMainWindow):
         self.tool_bar.addActions((self.new_record_action,
                                   self.remove_record_action, 
                                   self.open_record_action))
+        self.tool_bar.addSeparator()
+        self.tool_bar.addAction(self.export_records_action)
+        self.tool_bar.addSeparator()
+        self.tool_bar.addAction(self.search_records_action)
         
     def show_records_menubar(self):
         """
@@ -223,6 +289,9 @@ class MainWindow(QMainWindow):
         self.file_menu_item.addSeparator()
         self.file_menu_item.addAction(self.remove_record_action)
         self.file_menu_item.addAction(self.open_record_action)
+        self.file_menu_item.addSeparator()
+        self.file_menu_item.addAction(self.export_records_action)
+        self.file_menu_item.addAction(self.verify_records_action)
         # Hide icons in file menu
         for action in self.file_menu_item.actions():
             action.setIconVisibleInMenu(False)
@@ -235,34 +304,6 @@ class MainWindow(QMainWindow):
         self.help_menu_item.addAction(self.repo_help_action)
         self.help_menu_item.addAction(self.blushed_help_action)
     
-    def load_tickets(self):
-        """
-        Loads the tickets data into the main window table and 
-        also loads the summary row at the end.
-        """
-        self.table.setRowCount(0)
-        for index, row in self.tickets.data.iterrows():
-            self.table.insertRow(index-1)
-            for column_number, cell_data in enumerate(row):
-                self.table.setItem(index-1, column_number,
-                                   QTableWidgetItem(str(cell_data)))
-        self.load_summary()
-        self.table.scrollToBottom()
-        
-    def load_summary(self):
-        """
-        Loads the summary row at the end of the main window table and set the
-        row as uneditable by the user.
-        """
-        self.tickets.calculate_summary()
-        self.summary_row = self.table.rowCount()
-        self.table.insertRow(self.summary_row)
-        for col, cell_data in enumerate(self.tickets.summary):
-            self.table.setItem(self.summary_row, col, 
-                               QTableWidgetItem(str(cell_data)))
-        for col in range(self.table.columnCount()):
-            self.table.item(self.summary_row, col).setFlags(Qt.ItemFlag.ItemIsEnabled)
-        
     def add_tickets(self):
         """
         Executes the dialog to add tickets
@@ -272,41 +313,43 @@ class MainWindow(QMainWindow):
         
     def remove_ticket(self):
         """
-        Executes the dialog to remove tickets, it pass if the table is empty
+        Executes the dialog to remove the selected tickets, it pass if the
+        table is empty or only the summary row is selected
         """
-        try:
-            if self.is_not_summary():
-                self.dialog = RemoveTicketDialog()
-                self.dialog.exec()
-        except AttributeError:
-            pass
+        if self.selected_tickets():
+            self.dialog = RemoveTicketDialog()
+            self.dialog.exec()
         
     def edit_ticket(self):
         """
-        Executes the dialog to edit tickets, it pass if the table is empty
+        Executes the dialog to edit the selected tickets, it pass if the table
+        is empty or only the summary row is selected
         """
-        try:
-            if self.is_not_summary():
-                self.dialog = EditTicketDialog()
-                self.dialog.exec()
-        except AttributeError:
-            pass
+        if self.database_queue.busy:
+            return
+        if self.selected_tickets():
+            self.dialog = EditTicketDialog()
+            self.dialog.exec()
         
-    def is_not_summary(self) -> bool:
-        """Checks if the selected row by the user is not the summary row.
+    def selected_tickets(self) -> list:
+        """Gets the rows selected by the user on the tickets table, leaving 
+        out the summary row.
 
         Returns:
-            bool: True if the selected row is not the summary row
+            list: Sorted list of the selected rows
         """
-        row = self.table.currentRow()
-        if row != self.summary_row:
-            return True
+        rows = {index.row() for index in self.table.selectionModel().selectedRows()}
+        if not rows:
+            rows.add(self.table.currentIndex().row())
+        rows.discard(self.tickets_model.summary_row)
+        rows.discard(-1)
+        return sorted(rows)
         
     def save_record(self):
         """
         Executes the save record dialog, pass if the table is empty.
         """
-        if self.table.rowCount() == 0:
+        if len(self.tickets) == 0:
             pass
         else:
             self.dialog = SaveRecordDialog()
@@ -314,16 +357,18 @@ class MainWindow(QMainWindow):
         
     def load_records(self):
         """
-        Loads the records data into the main window table
+        Reloads the records in the main window table, they are fetched in 
+        pages as the user scrolls.
         """
-        self.table.setRowCount(0)
-        self.records.load_records()
-        for index, row in self.records.data.iterrows():
-            self.table.insertRow(index)
-            for column_number, cell_data in enumerate(row):
-                self.table.setItem(index, column_number,
-                                   QTableWidgetItem(str(cell_data)))
-        self.table.scrollToBottom()
+        self.records_model.refresh()
+        
+    def search_records(self):
+        """
+        Shows only the records whose name or tickets match the text of the
+        search box, all the records if it's empty.
+        """
+        self.records_model.set_search(self.search_box.text())
+        self.table.setColumnWidth(len(RecordsModel.HEADERS), 300)
         
     def view_records(self):
         """
@@ -331,7 +376,7 @@ class MainWindow(QMainWindow):
         tickets. If the table is empty then will show the records window
         directly
         """
-        if self.table.rowCount() == 0:
+        if len(self.tickets) == 0:
             self.show_records_window()
         else:
             self.dialog = ViewRecordsDialog()
@@ -344,29 +389,196 @@ class MainWindow(QMainWindow):
         """
         Executes the Remove Record Dialog if the current item is not None
         """
-        if self.table.currentItem() is not None:
+        if self.table.currentIndex().isValid():
             self.dialog = RemoveRecordDialog()
             self.dialog.exec()
             
     def open_record(self):
         """
         Loads the selected record on the table, into the tickets table. If the
-        current item is not None
+        current item is not None. The tickets are streamed from the database
+        thread in chunks, the first rows are shown as soon as they are read.
         """
-        if self.table.currentItem() is not None:
-            record_name = self.table.item(self.table.currentRow(), 1).text()
-            self.tickets.fetch_record(record_name)
+        if self.table.currentIndex().isValid() and not self.database_queue.busy:
+            record_name = self.records_model.record_name(self.table.currentIndex().row())
+            self.tickets = Tickets()
+            self.tickets_model.set_tickets(self.tickets)
             self.show_tickets_window()
-            self.load_tickets()
+            self.database_queue.submit(self.tickets.stream_record, record_name,
+                                       message=f"Abriendo {record_name}...",
+                                       on_chunk=self.tickets_model.load_chunk,
+                                       on_done=lambda _: self.table.scrollToBottom())
+            
+    def selected_records(self) -> list:
+        """Gets the names of the records selected by the user on the records
+        table.
+
+        Returns:
+            list: Names of the selected records, in the order of the table
+        """
+        rows = sorted(index.row() for index in
+                      self.table.selectionModel().selectedRows())
+        return [self.records_model.record_name(row) for row in rows]
+            
+    def export_records(self):
+        """
+        Executes the Export Records Dialog, to export the selected records
+        or the ones of a range of dates.
+        """
+        self.dialog = ExportRecordsDialog()
+        self.dialog.exec()
+            
+    def verify_records(self):
+        """
+        Rebuilds the totals of the records which don't match their tickets,
+        letting the user know how many were fixed.
+        """
+        self.database_queue.submit(self.records.verify_aggregates,
+                                   message="Verificando totales...",
+                                   on_done=self.records_verified)
+        
+    def records_verified(self, rebuilt:int):
+        """Reloads the records once their totals were verified, letting the
+        user know how many were fixed.
+
+        Args:
+            rebuilt (int): Number of records whose totals were rebuilt
+        """
+        self.load_records()
+        verify_message = QMessageBox()
+        verify_message.setWindowIcon(QIcon(":/success.png"))
+        verify_message.setWindowTitle("Totales verificados")
+        if rebuilt:
+            verify_message.setText(f"Se corrigieron los totales de {rebuilt} registro(s)")
+        else:
+            verify_message.setText("Los totales de todos los registros son correctos")
+        verify_message.exec()
+            
+    def set_busy(self, busy:bool, message:str):
+        """Shows the busy indicator while the database thread has pending
+        requests, disabling the actions which read or write the tickets and
+        the records meanwhile. The window stays interactive.
+
+        Args:
+            busy (bool): True if there are pending requests
+            message (str): Message of the oldest pending request
+        """
+        self.busy_label.setText(message)
+        self.busy_bar.setVisible(busy)
+        for action in self.storage_actions:
+            action.setEnabled(not busy)
+            
+    def database_error(self, error:Exception):
+        """QMessageBox to let the user know that a database request failed.
+
+        Args:
+            error (Exception): Exception raised by the request
+        """
+        error_message = QMessageBox()
+        error_message.setWindowIcon(QIcon(":/warning.png"))
+        error_message.setWindowTitle("Error")
+        error_message.setText(f"Ooops, ocurrió un error con la base de datos:\n{error}")
+        error_message.exec()
             
     def export_tickets(self):
         """
-        Executes the Export Tickets Dialog if the table is not empty.
+        Executes the Export Tickets Dialog if the table is not empty and there
+        isn't an export running.
         """
-        if self.table.rowCount() != 0:
+        if len(self.tickets) != 0 and self.export_job is None:
             self.dialog = ExportTicketsDialog()
             self.dialog.exec()
             
+    def start_export(self, file_type:str, path:str, file_name:str):
+        """Exports the tickets into a file on a background thread (see
+        'ExportJob'), showing its progress on the status bar. The tickets can
+        be edited meanwhile, a copy of them is exported.
+
+        Args:
+            file_type (str): Type of the file, "CSV", "EXCEL" or "PDF"
+            path (str): Directory where the file will be saved
+            file_name (str): Name of the file to export
+        """
+        self.export_job = ExportJob(self.export, self.tickets, file_type,
+                                    path, file_name)
+        self.export_job.progress.connect(self.export_progress)
+        self.export_job.done.connect(self.export_done)
+        self.export_job.failed.connect(self.export_error)
+        self.export_job.cancelled.connect(self.export_cancelled)
+        self.export_job.finished.connect(self.export_finished)
+        self.export_label.setText(f"Exportando {file_name}...")
+        self.export_bar.setRange(0, len(self.tickets))
+        self.export_bar.setValue(0)
+        for widget in (self.export_label, self.export_bar,
+                       self.export_cancel_button):
+            widget.show()
+        self.export_job.start()
+        
+    def export_progress(self, written:int, total:int):
+        """Shows the progress of the running export.
+
+        Args:
+            written (int): Written tickets
+            total (int): Total tickets
+        """
+        self.export_bar.setValue(written)
+        
+    def export_done(self, file:str):
+        """Lets the user know that the export has been successful, without
+        interrupting the work on the tickets.
+
+        Args:
+            file (str): Path of the exported file
+        """
+        self.statusBar().showMessage(f"Archivo exportado exitosamente: {file}",
+                                     10000)
+        
+    def export_cancelled(self):
+        """
+        Lets the user know that the export was cancelled.
+        """
+        self.statusBar().showMessage("Exportación cancelada", 5000)
+        
+    def export_error(self, error:Exception):
+        """QMessageBox to let the user know that the export failed.
+
+        Args:
+            error (Exception): Exception raised by the export
+        """
+        error_message = QMessageBox()
+        error_message.setWindowIcon(QIcon(":/warning.png"))
+        error_message.setWindowTitle("Error")
+        error_message.setText(f"Ooops, no se pudo exportar el archivo:\n{error}")
+        error_message.exec()
+        
+    def export_finished(self):
+        """
+        Hides the progress of the export once its thread is done.
+        """
+        for widget in (self.export_label, self.export_bar,
+                       self.export_cancel_button):
+            widget.hide()
+        self.export_job.wait()
+        self.export_job = None
+        
+    def cancel_export(self):
+        """
+        Cancels the running export, an existing file with the same name is
+        kept.
+        """
+        if self.export_job is not None:
+            self.export_label.setText("Cancelando exportación...")
+            self.export_job.cancel()
+            
+    def stop_export(self):
+        """
+        Cancels the running export, waiting for its thread. Used when the
+        application quits.
+        """
+        if self.export_job is not None:
+            self.export_job.cancel()
+            self.export_job.wait()
+            
     def change_export_path(self):
         """
         Executes the Change Export Path dialog.
@@ -378,7 +590,7 @@ class MainWindow(QMainWindow):
         """
         Executes the Clear Tickets Dialog if the table is not empty.
         """
-        if self.table.rowCount() != 0:
+        if len(self.tickets) != 0:
             self.dialog = ClearTicketsDialog()
             self.dialog.exec()
             
@@ -412,14 +624,14 @@ class AddTicketDialog(QDialog):
         
         # Dialog widgets
         self.ticket_id_label = QLabel("Ticket ID: "\
-                                      f"{len(main_window.tickets.data) + 1}")
+                                      f"{len(main_window.tickets) + 1}")
         layout.addWidget(self.ticket_id_label, 0, 0, 1, 2, 
                          Qt.AlignmentFlag.AlignHCenter)
         
         ticket_name_label = QLabel("Ticket:")
         layout.addWidget(ticket_name_label, 1, 0, 1, 2)
         
-        self.ticket_name = QLineEdit(f"Ticket {len(main_window.tickets.data) + 1}")
+        self.ticket_name = QLineEdit(f"Ticket {len(main_window.tickets) + 1}")
         self.ticket_name.setValidator(main_window.text_validator)
         layout.addWidget(self.ticket_name, 2, 0, 1, 2)
         
@@ -456,14 +668,14 @@ class AddTicketDialog(QDialog):
         if self.ticket_total.text() == "" or self.ticket_name.text() == "":
             self.value_warning()
         else:
-            main_window.tickets.add_ticket(self.ticket_name.text(),
-                                        float(self.ticket_total.text()))
-            main_window.load_tickets()
+            main_window.tickets_model.add_ticket(self.ticket_name.text(),
+                                                 parse_amount(self.ticket_total.text()))
+            main_window.table.scrollToBottom()
             self.ticket_total.clear()
             self.ticket_total.setFocus()
             self.ticket_id_label.setText("Ticket ID: "\
-                                        f"{len(main_window.tickets.data) + 1}")
-            self.ticket_name.setText(f"Ticket {len(main_window.tickets.data) + 1}")
+                                        f"{len(main_window.tickets) + 1}")
+            self.ticket_name.setText(f"Ticket {len(main_window.tickets) + 1}")
         
             
     def value_warning(self):
@@ -477,33 +689,35 @@ class AddTicketDialog(QDialog):
         value_message.setText("Ooops, parece que te faltó llenar un campo")
         value_message.exec()
         self.ticket_total.clear()
-        self.ticket_name.setText(f"Ticket {len(main_window.tickets.data) + 1}")
+        self.ticket_name.setText(f"Ticket {len(main_window.tickets) + 1}")
         self.ticket_total.setFocus()
         
         
 class RemoveTicketDialog(QDialog):
     """
-    QDialog to remove an specific ticket from the main window table.
-    The ticket to be removed will be the one selected from the user on the table.
-    If the user does not select a ticket, by default ID = 1 is selected. 
+    QDialog to remove the tickets selected by the user on the main window
+    table. All the selected tickets are removed at once.
     """
     def __init__(self):
         super().__init__()
         # Dialog config
         self.setWindowIcon(QIcon(":/remove.png"))
-        self.setWindowTitle("Eliminar ticket")
+        self.setWindowTitle("Eliminar tickets")
         self.setFixedSize(270,100)
         layout = QGridLayout()
         
-        # Get the ticket ID, based on the selected row on the table
-        self.ticket_id = int(main_window.table.item(main_window.table.currentRow(),
-                                                    0).text())
+        # Get the tickets uids and positions, based on the selected rows
+        rows = main_window.selected_tickets()
+        self.ticket_ids = [main_window.tickets.uid_at(row) for row in rows]
         
         # Dialog widgets
-        label = QLabel("¿Estás seguro que deseas eliminar esta ticket?")
+        if len(rows) == 1:
+            label = QLabel("¿Estás seguro que deseas eliminar esta ticket?")
+            ticket_label = QLabel(f"Ticket ID: {rows[0] + 1}")
+        else:
+            label = QLabel("¿Estás seguro que deseas eliminar estos tickets?")
+            ticket_label = QLabel(f"Tickets seleccionados: {len(rows)}")
         layout.addWidget(label, 0, 0, 1, 2)
-        
-        ticket_label = QLabel(f"Ticket ID: {self.ticket_id}")
         layout.addWidget(ticket_label, 1, 0, 1, 2, Qt.AlignmentFlag.AlignHCenter)
         
         yes_button = QPushButton("Si")
@@ -518,53 +732,63 @@ class RemoveTicketDialog(QDialog):
         
     def remove_ticket(self):
         """
-        Removes the selected ticket from the main window table and update it
+        Removes the selected tickets from the main window table and update it
         """
-        main_window.tickets.remove_ticket(self.ticket_id)
-        main_window.load_tickets()
+        main_window.tickets_model.remove_tickets(self.ticket_ids)
         self.close()
         
         
 class EditTicketDialog(QDialog):
     """
-    QDialog, to edit an specific ticket from the main window table. 
-    The ticket to be removed will be the one selected from the user on the table.
-    If the user does not select a ticket, by default ID = 1 is selected.
+    QDialog, to edit the tickets selected by the user on the main window table.
+    With a single ticket the inputs show its current values. With multiple
+    tickets the inputs start empty, and only the filled ones are applied to
+    all the selected tickets.
     """
     def __init__(self):
         super().__init__()
         # Dialog config
         self.setWindowIcon(QIcon(":/edit.png"))
-        self.setWindowTitle("Editar ticket")
+        self.setWindowTitle("Editar tickets")
         self.setFixedSize(200,200)
         layout = QGridLayout()
         
-        # Get the ticket ID, based on the selected row on the table
-        self.ticket_id = int(main_window.table.item(main_window.table.currentRow(),
-                                                    0).text())
+        # Get the tickets uids and positions, based on the selected rows
+        rows = main_window.selected_tickets()
+        self.ticket_ids = [main_window.tickets.uid_at(row) for row in rows]
+        self.bulk_edit = len(rows) > 1
         
         # Dialog widgets
-        self.ticket_id_label = QLabel(f"Ticket ID: {self.ticket_id}")
+        if self.bulk_edit:
+            self.ticket_id_label = QLabel(f"Tickets seleccionados: {len(rows)}")
+        else:
+            self.ticket_id_label = QLabel(f"Ticket ID: {rows[0] + 1}")
         layout.addWidget(self.ticket_id_label, 0, 0, 1, 2, 
                          Qt.AlignmentFlag.AlignHCenter)
         
         ticket_name_label = QLabel("Ticket:")
         layout.addWidget(ticket_name_label, 1, 0, 1, 2)
         
-        self.ticket_name = QLineEdit(main_window.table.item(
-            main_window.table.currentRow(), 1).text())
+        self.ticket_name = QLineEdit()
         self.ticket_name.setValidator(main_window.text_validator)
         layout.addWidget(self.ticket_name, 2, 0, 1, 2)
         
         ticket_total_label = QLabel("Total:")
         layout.addWidget(ticket_total_label, 3, 0, 1, 2)
         
-        self.ticket_total = QLineEdit(main_window.table.item(
-            main_window.table.currentRow(),2).text())
+        self.ticket_total = QLineEdit()
         self.ticket_total.setPlaceholderText("$")
         self.ticket_total.setValidator(main_window.float_validator) # Decimal number validator
         layout.addWidget(self.ticket_total, 4, 0, 1, 2)
         
+        if self.bulk_edit:
+            self.ticket_name.setPlaceholderText("Sin cambios")
+            self.ticket_total.setPlaceholderText("$ Sin cambios")
+        else:
+            _, ticket_name, ticket_total, *_ = main_window.tickets.ticket_at(rows[0])
+            self.ticket_name.setText(ticket_name)
+            self.ticket_total.setText(format_cents(ticket_total))
+        
         # Vertical spacing for buttons
         layout.addItem(QSpacerItem(20,20), 5, 0, 1, 2)
         
@@ -583,16 +807,21 @@ class EditTicketDialog(QDialog):
         
     def edit_ticket(self):
         """
-        Updates the selected ticket with the given information by the user and
+        Updates the selected tickets with the given information by the user and
         re-loads the main window table.
         """
-        if self.ticket_total.text() == "" or self.ticket_name.text() == "":
-            self.value_warning()
-        else:
-            main_window.tickets.edit_ticket(self.ticket_id, self.ticket_name.text(), 
-                                            float(self.ticket_total.text()))
-            main_window.load_tickets()
+        ticket_name = self.ticket_name.text() or None
+        ticket_total = self.ticket_total.text() or None
+        if self.bulk_edit and (ticket_name or ticket_total):
+            main_window.tickets_model.edit_tickets(self.ticket_ids, ticket_name,
+                                                   ticket_total and parse_amount(ticket_total))
+            self.close()
+        elif not self.bulk_edit and ticket_name and ticket_total:
+            main_window.tickets_model.edit_tickets(self.ticket_ids, ticket_name,
+                                                   parse_amount(ticket_total))
             self.close()
+        else:
+            self.value_warning()
             
     def value_warning(self):
         """
@@ -687,29 +916,35 @@ class SaveRecordDialog(QDialog):
         """
         if self.record_name.text() == "":
             self.value_warning()
-        elif self.record_name.text() in main_window.records.fetch_all_names():
+        elif main_window.records.record_exists(self.record_name.text()):
             self.record_exists()
         else:
             self.save_record()
             
     def save_record(self):
         """
-        Saves the record in the databse
+        Saves the record in the databse on the database thread, the tickets
+        are cleared once it's saved.
         """
-        main_window.tickets.save_record(self.record_name.text())
-        main_window.records.add_record(main_window.tickets.data,
-                                    self.record_name.text())
-        self.clear_tickets()
+        main_window.database_queue.submit(main_window.records.save_record,
+                                          main_window.tickets,
+                                          self.record_name.text(),
+                                          message="Guardando registro...",
+                                          on_done=lambda _: self.record_saved())
         self.close()
+        
+    def record_saved(self):
+        """
+        Clears the saved tickets and lets the user know.
+        """
+        self.clear_tickets()
         self.success_message()
         
     def clear_tickets(self):
         """
-        Clear the tickets.data DataFrame and reset the rows on the main window
-        table.
+        Clear the tickets and reset the rows on the main window table.
         """
-        main_window.table.setRowCount(0)
-        main_window.tickets.clear_data()
+        main_window.tickets_model.clear()
         
     def record_exists(self):
         """
@@ -780,8 +1015,8 @@ class RemoveRecordDialog(QDialog):
         layout = QGridLayout()
         
         # Get the ticket ID, based on the selected row on the table
-        self.record_name = main_window.table.item(main_window.table.currentRow(),
-                                                  1).text()
+        self.record_name = main_window.records_model.record_name(
+            main_window.table.currentIndex().row())
         
         # Dialog widgets
         label = QLabel("¿Estás seguro que deseas eliminar este registro?")
@@ -802,10 +1037,13 @@ class RemoveRecordDialog(QDialog):
         
     def remove_record(self):
         """
-        Removes the selected record from the database and updates the table.
+        Removes the selected record from the database on the database thread,
+        the table is updated once it's removed.
         """
-        main_window.records.remove_record(self.record_name)
-        main_window.load_records()
+        main_window.database_queue.submit(main_window.records.remove_record,
+                                          self.record_name,
+                                          message="Eliminando registro...",
+                                          on_done=lambda _: main_window.load_records())
         self.close()
         
     
@@ -876,29 +1114,15 @@ class ExportTicketsDialog(QDialog):
     def export_tickets(self):
         """
         Exports the list of tickets in the main window table in the selected 
-        type of file and directory.
+        type of file and directory. The file is written on a background
+        thread, the main window shows its progress.
         """
         if self.file_name.text() == "" or self.directory_path == "":
             self.value_warning()
         else:
-            file_type = self.file_type_box.currentIndex()
-            file_name = self.file_name.text()
-            
-            if file_type == 0:
-                main_window.export.to_csv(main_window.tickets.data,
-                                          self.directory_path, file_name)
-                self.close()
-                self.success_message()
-            elif file_type == 1:
-                main_window.export.to_excel(main_window.tickets.data,
-                                            self.directory_path, file_name)
-                self.close()
-                self.success_message()
-            else:
-                main_window.export.to_pdf(main_window.tickets.data,
-                                          self.directory_path, file_name)
-                self.close()
-                self.success_message()
+            main_window.start_export(self.file_type_box.currentText(),
+                                     self.directory_path, self.file_name.text())
+            self.close()
             
     def value_warning(self):
         """
@@ -909,15 +1133,223 @@ class ExportTicketsDialog(QDialog):
         value_message.setWindowTitle("Advertencia")
         value_message.setText("Ooops, parece que te faltó llenar un campo")
         value_message.exec()
+        
+        
+class ExportRecordsDialog(QDialog):
+    """
+    QDialog to export many records at once, each one into its own file named
+    after the record. The records are the ones selected by the user on the
+    records table, or the ones saved in a range of dates. The files are
+    written in parallel by a pool of processes (see 'BatchExport'), the
+    progress is shown in the dialog and the export can be cancelled.
+    """
+    def __init__(self):
+        super().__init__()
+        
+        self.directory_path = main_window.export.path
+        self.selected_records = main_window.selected_records()
+        self.exported_records = 0
+        self.failed_records = []
+        self.batch_export = BatchExport(self)
+        self.batch_export.file_exported.connect(self.file_exported)
+        self.batch_export.progress.connect(self.show_progress)
+        self.batch_export.finished.connect(self.export_finished)
+        
+        # Dialog config
+        self.setWindowIcon(QIcon(":/export.png"))
+        self.setWindowTitle("Exportar registros")
+        self.setFixedSize(300,360)
+        layout = QGridLayout()
+        
+        # Dialog widgets
+        records_label = QLabel("Registros:")
+        layout.addWidget(records_label, 0, 0, 1, 2)
+        
+        self.records_box = QComboBox()
+        self.records_box.addItems((f"Seleccionados ({len(self.selected_records)})",
+                                   "Rango de fechas"))
+        self.records_box.currentIndexChanged.connect(self.records_changed)
+        layout.addWidget(self.records_box, 1, 0, 1, 2)
+        
+        today = QDate.currentDate()
+        self.date_from = QDateEdit(QDate(today.year(), today.month(), 1))
+        self.date_to = QDateEdit(today)
+        for column, date_edit in enumerate((self.date_from, self.date_to)):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("dd/MM/yyyy")
+            layout.addWidget(date_edit, 2, column)
+        
+        file_type_label = QLabel("Tipo de archivo:")
+        layout.addWidget(file_type_label, 3, 0, 1, 2)
+        
+        self.file_type_box = QComboBox()
+        self.file_type_box.addItems(("CSV", "EXCEL", "PDF"))
+        layout.addWidget(self.file_type_box, 4, 0, 1, 2)
+        
+        self.path_label = QLabel("Ruta de exportado:")
+        layout.addWidget(self.path_label, 5, 0, 1, 2)
+        
+        self.file_path = QLineEdit()
+        self.file_path.setReadOnly(True)
+        self.file_path.setText(self.directory_path)
+        layout.addWidget(self.file_path, 6, 0, 1, 2)
+        
+        directory_button = QPushButton("Seleccionar ruta")
+        directory_button.clicked.connect(self.select_path_dialog)
+        layout.addWidget(directory_button, 7, 0, 1, 2)
+        
+        # Progress of the export
+        self.progress_label = QLabel()
+        layout.addWidget(self.progress_label, 8, 0, 1, 2)
+        
+        self.progress_bar = QProgressBar()
+        self.progress_bar.hide()
+        layout.addWidget(self.progress_bar, 9, 0, 1, 2)
+        
+        # Vertical spacing for buttons
+        layout.addItem(QSpacerItem(20,20), 10, 0, 1, 2)
+        
+        self.yes_button = QPushButton("Exportar")
+        self.yes_button.clicked.connect(self.export_records)
+        layout.addWidget(self.yes_button, 11, 0)
+        
+        no_button = QPushButton("Cancelar")
+        no_button.clicked.connect(self.reject)
+        layout.addWidget(no_button, 11, 1)
+        
+        self.setLayout(layout)
+        
+        # Without a selection, the records of the current month are proposed
+        if not self.selected_records:
+            self.records_box.setCurrentIndex(1)
+        self.records_changed(self.records_box.currentIndex())
+        
+    def records_changed(self, index:int):
+        """Enables the dates only when the records are taken from a range of
+        dates.
 
-    def success_message(self):
+        Args:
+            index (int): Current index of the records box
+        """
+        self.date_from.setEnabled(index == 1)
+        self.date_to.setEnabled(index == 1)
+        
+    def select_path_dialog(self):
+        """
+        Opens a QFileDialog for the user to choose a directory to export.
+        """
+        self.directory_path = QFileDialog().getExistingDirectory()
+        self.file_path.setText(self.directory_path)
+        
+    def export_records(self):
+        """
+        Exports the chosen records in the selected type of file and directory.
+        The records of a range of dates are looked up on the database thread
+        first.
+        """
+        if self.directory_path == "":
+            self.value_warning()
+        elif self.records_box.currentIndex() == 0:
+            self.start_export(self.selected_records)
+        else:
+            self.yes_button.setEnabled(False)
+            main_window.database_queue.submit(main_window.records.query,
+                                              self.date_from.date().toPython(),
+                                              self.date_to.date().toPython(),
+                                              message="Buscando registros...",
+                                              on_done=lambda records:
+                                                  self.start_export(
+                                                      records["Name"].tolist()))
+            
+    def start_export(self, record_names:list):
+        """Starts exporting the given records, unless the dialog was closed
+        meanwhile.
+
+        Args:
+            record_names (list): Names of the records
+        """
+        if not self.isVisible():
+            return
+        if not record_names:
+            self.yes_button.setEnabled(True)
+            self.value_warning("No hay registros para exportar")
+            return
+        self.yes_button.setEnabled(False)
+        self.exported_records = 0
+        self.failed_records = []
+        self.progress_bar.setRange(0, len(record_names))
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.show_progress(0, len(record_names))
+        self.batch_export.start(record_names, self.file_type_box.currentText(),
+                                self.directory_path)
+        
+    def file_exported(self, record_name:str, error:Exception):
+        """Counts the result of an exported file.
+
+        Args:
+            record_name (str): Name of the record
+            error (Exception | None): Exception raised by the export, None if
+                the file was exported
         """
-        QMessageBox to let the user know that the export has been successful.
+        if error is None:
+            self.exported_records += 1
+        else:
+            self.failed_records.append(record_name)
+            
+    def show_progress(self, done:int, total:int):
+        """Shows the progress of the export.
+
+        Args:
+            done (int): Finished files
+            total (int): Total files
+        """
+        self.progress_bar.setValue(done)
+        self.progress_label.setText(f"Exportando registros: {done} de {total}")
+        
+    def export_finished(self, cancelled:bool):
+        """Lets the user know the result of the export, closing the dialog.
+
+        Args:
+            cancelled (bool): True if the export was cancelled
         """
+        self.close()
         value_message = QMessageBox()
-        value_message.setWindowIcon(QIcon(":/success.png"))
-        value_message.setWindowTitle("Exportación exitosa")
-        value_message.setText("El archivo ha sido exportado exitosamente!")
+        if cancelled or self.failed_records:
+            value_message.setWindowIcon(QIcon(":/warning.png"))
+            value_message.setWindowTitle("Advertencia")
+        else:
+            value_message.setWindowIcon(QIcon(":/success.png"))
+            value_message.setWindowTitle("Exportación exitosa")
+        text = f"Se exportaron {self.exported_records} registro(s)"
+        if cancelled:
+            text += ", la exportación fue cancelada"
+        if self.failed_records:
+            text += "\nNo se pudieron exportar:\n" + "\n".join(self.failed_records)
+        value_message.setText(text)
+        value_message.exec()
+        
+    def reject(self):
+        """
+        Closes the dialog, cancelling the running export. The dialog is
+        closed once the files being written are done.
+        """
+        if self.batch_export.running:
+            self.progress_label.setText("Cancelando exportación...")
+            self.batch_export.cancel()
+        else:
+            super().reject()
+            
+    def value_warning(self, text:str="Ooops, parece que te faltó llenar un campo"):
+        """QMessageBox to let the user know it's missing an input.
+
+        Args:
+            text (str, optional): Message. Defaults to a missing input message.
+        """
+        value_message = QMessageBox()
+        value_message.setWindowIcon(QIcon(":/warning.png"))
+        value_message.setWindowTitle("Advertencia")
+        value_message.setText(text)
         value_message.exec()
         
         
@@ -1036,8 +1468,7 @@ class ClearTicketsDialog(QDialog):
         """
         Clear the tickets data and reset the table.
         """
-        main_window.table.setRowCount(0)
-        main_window.tickets.clear_data()
+        main_window.tickets_model.clear()
         self.close()
         
         
@@ -1063,7 +1494,11 @@ class PdfViewerWindow(QPdfView):
         
           
 if __name__ == "__main__":
+    freeze_support() # Processes of the batch exports in the frozen app
     app = QApplication(argv)
     main_window = MainWindow()
+    app.aboutToQuit.connect(main_window.stop_export)
+    app.aboutToQuit.connect(main_window.database_queue.stop)
+    app.aboutToQuit.connect(get_database().close)
     main_window.show()
     exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+Versioned schema migrations of the records database. The version of a
+database is kept in 'PRAGMA user_version', it's the number of steps of
+MIGRATIONS already applied to it. Each pending step runs once, in its own
+transaction along with the version bump, so a database is never left half
+migrated. Databases created before the versioning start at version 0, so
+the first steps must also work when their changes are already there.
+"""
+import sqlite3 as db
+
+# Summary columns of a record computed from its tickets, correlated with the
+# updated row of the records table
+RECORD_SUMMARY = "SELECT COUNT(*), COALESCE(SUM(total_cents), 0) / 100.0, "\
+                 "COALESCE(SUM(sub_total_cents), 0) / 100.0, "\
+                 "COALESCE(SUM(iva_cents), 0) / 100.0 "\
+                 "FROM tickets WHERE record_id=records.ID"
+UPDATE_SUMMARY = "UPDATE records SET (Tickets, Total, SubTotal, IVA)="\
+                 f"({RECORD_SUMMARY})"
+
+
+def create_records_table(conn:db.Connection) -> None:
+    """
+    Creates the records table. With the following columns:
+    - ID (primary key -> Int)
+    - Name (-> Text)
+    - DateC (Creation date-> Text)
+    - DateM (Modification date -> Text)
+    - Tickets (Number of tickets -> Integer)
+    - Total (Sum of the totals -> Real)
+    - SubTotal (Sum of the Sub-Totals -> Real)
+    - IVA (Sum of the taxes -> Real)
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS records(ID INTEGER PRIMARY KEY,"\
+                                                    "Name TEXT,"\
+                                                    "DateC TEXT,"\
+                                                    "DateM TEXT,"\
+                                                    "Tickets INTEGER,"\
+                                                    "Total REAL,"\
+                                                    "SubTotal REAL,"\
+                                                    "IVA REAL)")
+
+
+def create_export_path_table(conn:db.Connection) -> None:
+    """
+    Creates the 'export_path' table, which holds the exports directory.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS export_path (ID INTEGER PRIMARY KEY," \
+                 "Path TEXT)")
+
+
+def create_tickets_table(conn:db.Connection) -> None:
+    """Creates the tickets table, which holds the tickets of all the
+    records, and moves into it the tickets of the old per-record tables,
+    dropping them afterwards. If there are records with the same name, the
+    tickets of their table are moved to the newest one (greatest ID).
+    The table has the following columns:
+    - record_id (ID of the record -> Integer)
+    - position (Order of the ticket in the record -> Integer)
+    - name (Name of the ticket -> Text)
+    - total_cents (Total in cents -> Integer)
+    - sub_total_cents (Sub-Total in cents -> Integer)
+    - iva_cents (Taxes in cents -> Integer)
+    The primary key (record_id, position) indexes the tickets by record.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE name=='tickets' "\
+                "AND sql LIKE '%record_id%'")
+    if cur.fetchone() is not None:
+        return
+    # A repeated name has a single table, it goes to the newest record
+    cur.execute("SELECT MAX(records.ID), records.Name FROM records "\
+                "JOIN sqlite_master ON sqlite_master.name==records.Name "\
+                "WHERE sqlite_master.type=='table' GROUP BY records.Name")
+    record_tables = cur.fetchall()
+    if "tickets" in (name for _, name in record_tables):
+        # A record named 'tickets' would clash with the new table
+        cur.execute("ALTER TABLE tickets RENAME TO tickets_old_record")
+        record_tables = [(record_id, "tickets_old_record"
+                          if name == "tickets" else name)
+                         for record_id, name in record_tables]
+    cur.execute("CREATE TABLE tickets(record_id INTEGER NOT NULL "\
+                                     "REFERENCES records(ID),"\
+                                     "position INTEGER NOT NULL,"\
+                                     "name TEXT NOT NULL,"\
+                                     "total_cents INTEGER NOT NULL,"\
+                                     "sub_total_cents INTEGER NOT NULL,"\
+                                     "iva_cents INTEGER NOT NULL,"\
+                                     "PRIMARY KEY (record_id, position))")
+    for record_id, name in record_tables:
+        table = '"' + name.replace('"', '""') + '"'
+        cur.execute("INSERT INTO tickets(record_id, position, name, "\
+                    "total_cents, sub_total_cents, iva_cents) "\
+                    "SELECT ?, ROW_NUMBER() OVER (ORDER BY ID), Ticket, "\
+                    "CAST(ROUND(Total * 100) AS INTEGER), "\
+                    "CAST(ROUND(\"Sub-Total\" * 100) AS INTEGER), "\
+                    f"CAST(ROUND(IVA * 100) AS INTEGER) FROM {table}",
+                    (record_id,))
+        cur.execute(f"DROP TABLE {table}")
+
+
+def create_records_name_index(conn:db.Connection) -> None:
+    """Creates the unique index 'records_name' on the Name column of the
+    records table. If there are repeated names, the newest record (greatest
+    ID) of each name keeps it and the older ones are renamed to
+    'Name (ID)', so no record is lost.
+    """
+    names = {name for name, in conn.execute("SELECT Name FROM records")}
+    cur = conn.execute("SELECT ID, Name FROM records WHERE ID NOT IN ("\
+                       "SELECT MAX(ID) FROM records GROUP BY Name)")
+    for record_id, name in cur.fetchall():
+        new_name = f"{name} ({record_id})"
+        while new_name in names: # The new name may be taken as well
+            new_name += f" ({record_id})"
+        names.add(new_name)
+        conn.execute("UPDATE records SET Name=? WHERE ID==?", (new_name, record_id))
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS records_name ON records(Name)")
+
+
+def convert_dates_to_iso(conn:db.Connection) -> None:
+    """Converts the DateC and DateM columns of the records table from
+    'dd/mm/YYYY' to ISO-8601 ('YYYY-MM-DD'), so they sort and compare as
+    dates. Empty modification dates become NULL. Also indexes both columns
+    for the date range queries.
+    """
+    for column in ("DateC", "DateM"):
+        conn.execute(f"UPDATE records SET {column}=substr({column}, 7, 4) || '-' || "\
+                     f"substr({column}, 4, 2) || '-' || substr({column}, 1, 2) "\
+                     f"WHERE {column} LIKE '__/__/____'")
+    conn.execute("UPDATE records SET DateM=NULL WHERE DateM==''")
+    conn.execute("CREATE INDEX IF NOT EXISTS records_datec ON records(DateC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS records_datem ON records(DateM)")
+
+
+def create_search_index(conn:db.Connection) -> None:
+    """Creates the FTS5 full-text indexes of the record names and the ticket
+    names:
+    - records_search: External content index of records.Name, its rowid is
+      the ID of the record. Kept in sync with the records by triggers.
+    - tickets_search: Index of tickets.name, its rowid is the key of the
+      ticket, (record_id << 32) | position, so the hits of a record are a
+      rowid range. It's written in bulk along with the tickets (see
+      'Tickets.save_record' and 'Records.remove_record'), since FTS5
+      flushes its pending changes on the savepoint of every trigger, which
+      makes a row trigger far slower than a batch.
+    - tickets_search_terms: Vocabulary of tickets_search, used to expand the
+      searched prefixes into words.
+    Diacritics are ignored by both ('camion' matches 'camión').
+    """
+    conn.execute("CREATE VIRTUAL TABLE records_search USING fts5(Name, "\
+                 "content='records', content_rowid='ID', "\
+                 "tokenize='unicode61 remove_diacritics 2')")
+    conn.execute("CREATE VIRTUAL TABLE tickets_search USING fts5(name, "\
+                 "prefix='1 2 3', tokenize='unicode61 remove_diacritics 2')")
+    conn.execute("CREATE VIRTUAL TABLE tickets_search_terms USING "\
+                 "fts5vocab(tickets_search, 'row')")
+    conn.execute("CREATE TRIGGER records_search_insert AFTER INSERT ON records "\
+                 "BEGIN "\
+                 "INSERT INTO records_search(rowid, Name) VALUES (NEW.ID, NEW.Name); "\
+                 "END")
+    conn.execute("CREATE TRIGGER records_search_delete AFTER DELETE ON records "\
+                 "BEGIN "\
+                 "INSERT INTO records_search(records_search, rowid, Name) "\
+                 "VALUES ('delete', OLD.ID, OLD.Name); "\
+                 "END")
+    conn.execute("CREATE TRIGGER records_search_update AFTER UPDATE OF Name "\
+                 "ON records WHEN OLD.Name IS NOT NEW.Name "\
+                 "BEGIN "\
+                 "INSERT INTO records_search(records_search, rowid, Name) "\
+                 "VALUES ('delete', OLD.ID, OLD.Name); "\
+                 "INSERT INTO records_search(rowid, Name) VALUES (NEW.ID, NEW.Name); "\
+                 "END")
+    conn.execute("INSERT INTO records_search(records_search) VALUES ('rebuild')")
+    conn.execute("INSERT INTO tickets_search(rowid, name) "\
+                 "SELECT (record_id << 32) | position, name FROM tickets")
+
+
+def rebuild_record_summaries(conn:db.Connection) -> None:
+    """Rebuilds the summary columns of the records table (Tickets, Total,
+    SubTotal and IVA) from the tickets table. From then on, the summary of
+    a record is refreshed along with its tickets, in the same transaction
+    (see 'Records.save_record').
+    """
+    conn.execute(UPDATE_SUMMARY)
+
+
+# Ordered upgrade steps, never reorder or remove them, only append new ones
+MIGRATIONS = (create_records_table,
+              create_export_path_table,
+              create_tickets_table,
+              create_records_name_index,
+              convert_dates_to_iso,
+              create_search_index,
+              rebuild_record_summaries)
+
+
+def migrate(conn:db.Connection) -> int:
+    """Upgrades the database to the latest version, running the pending
+    migration steps in order. Each step is applied in its own transaction.
+
+    Args:
+        conn (db.Connection): Connection to the database, in autocommit mode
+
+    Returns:
+        int: Version of the database after the upgrade
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    while version < len(MIGRATIONS):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated the database meanwhile
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < len(MIGRATIONS):
+                MIGRATIONS[version](conn)
+                version += 1
+                conn.execute(f"PRAGMA user_version={version}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    return version
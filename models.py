@@ -0,0 +1,347 @@
+from datetime import datetime
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+import numpy as np
+from tickets import Tickets, COLUMNS, format_cents
+from records import Records, DATE_FORMAT, FIRST_PAGE
+from workers import DatabaseQueue
+
+MAX_ROW_SIGNALS = 32 # Above this number of row blocks the model is reset
+
+
+class TicketsModel(QAbstractTableModel):
+    """
+    Table model which reads the tickets straight from the Tickets column
+    arrays. Only the cells shown by the view are formatted, and the changes
+    made through the model emit row signals for the affected rows only. When
+    there are tickets, a summary row is shown at the end.
+    """
+    def __init__(self, tickets:Tickets):
+        super().__init__()
+        self.tickets = tickets
+
+    @property
+    def summary_row(self) -> int:
+        """Row where the summary is shown, -1 if there are no tickets.
+
+        Returns:
+            int: Summary row
+        """
+        return len(self.tickets) if len(self.tickets) else -1
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.tickets) + 1 if len(self.tickets) else 0
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(COLUMNS)
+
+    def headerData(self, section:int, orientation:Qt.Orientation,
+                   role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and \
+            orientation == Qt.Orientation.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index:QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        row, column = index.row(), index.column()
+        if row == self.summary_row:
+            values = ("", "TOTAL", *self.tickets.summary_cents)
+        else:
+            values = (row + 1, *self.tickets.ticket_at(row)[1:])
+        if column >= 2: # Money columns
+            return format_cents(values[column])
+        return str(values[column])
+
+    def flags(self, index:QModelIndex) -> Qt.ItemFlag:
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        if index.row() == self.summary_row:
+            return Qt.ItemFlag.ItemIsEnabled
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+    def _summary_changed(self) -> None:
+        """
+        Emits the dataChanged signal for the summary row.
+        """
+        row = self.summary_row
+        if row != -1:
+            self.dataChanged.emit(self.index(row, 0),
+                                  self.index(row, len(COLUMNS) - 1))
+
+    def add_ticket(self, ticket_name:str, ticket_total:float) -> int:
+        """Adds a new ticket, inserting its row in the view.
+
+        Args:
+            ticket_name (str): Name of the ticket
+            ticket_total (float): Total amount of the ticket
+
+        Returns:
+            int: uid of the new ticket
+        """
+        return self.add_tickets([ticket_name], [ticket_total])[0]
+
+    def add_tickets(self, ticket_names, ticket_totals) -> np.ndarray:
+        """Adds a batch of tickets, inserting their rows in the view.
+
+        Args:
+            ticket_names (Sequence[str]): Names of the tickets
+            ticket_totals (Sequence[float]): Total amounts of the tickets
+
+        Returns:
+            np.ndarray: uids of the new tickets
+        """
+        if len(ticket_names) == 0:
+            return np.empty(0, dtype=np.int64)
+        first = len(self.tickets)
+        last = first + len(ticket_names) - 1
+        if first == 0:
+            last += 1 # The summary row appears with the first tickets
+        self.beginInsertRows(QModelIndex(), first, last)
+        uids = self.tickets.add_tickets(ticket_names, ticket_totals)
+        self.endInsertRows()
+        self._summary_changed()
+        return uids
+
+    def load_chunk(self, chunk:tuple) -> None:
+        """Appends a chunk of a streamed record (see 'Tickets.stream_record'),
+        inserting its rows in the view.
+
+        Args:
+            chunk (tuple): Record ID and column arrays of the chunk
+        """
+        if len(chunk[1]) == 0: # e.g. a record without tickets
+            self.tickets.load_chunk(chunk)
+            return
+        first = len(self.tickets)
+        last = first + len(chunk[1]) - 1
+        if first == 0:
+            last += 1 # The summary row appears with the first tickets
+        self.beginInsertRows(QModelIndex(), first, last)
+        self.tickets.load_chunk(chunk)
+        self.endInsertRows()
+        self._summary_changed()
+
+    def remove_tickets(self, uids) -> None:
+        """Removes the tickets with the given uids. A removal signal is emitted
+        for each block of consecutive rows, unless there are too many blocks,
+        in which case the model is reset.
+
+        Args:
+            uids (Sequence[int]): uids of the tickets to be removed
+        """
+        uids = np.unique(np.asarray(uids, dtype=np.int64))
+        if len(uids) == 0:
+            return
+        if len(uids) == len(self.tickets):
+            self.clear()
+            return
+        rows = self.tickets.rows_of(uids)
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        blocks = np.split(np.arange(len(rows)), breaks)
+        if len(blocks) > MAX_ROW_SIGNALS:
+            self.beginResetModel()
+            self.tickets.remove_tickets(uids)
+            self.endResetModel()
+            return
+        for block in reversed(blocks):
+            self.beginRemoveRows(QModelIndex(), int(rows[block[0]]),
+                                 int(rows[block[-1]]))
+            self.tickets.remove_tickets(uids[block])
+            self.endRemoveRows()
+        self._summary_changed()
+
+    def edit_tickets(self, uids, ticket_names=None, ticket_totals=None) -> None:
+        """Edits the tickets with the given uids (see 'Tickets.edit_tickets'),
+        emitting dataChanged for the edited rows and the summary row.
+
+        Args:
+            uids (Sequence[int]): uids of the tickets to be edited
+            ticket_names (str | Sequence[str], optional): New names of the
+                tickets. Defaults to None.
+            ticket_totals (float | Sequence[float], optional): New total
+                amounts of the tickets. Defaults to None.
+        """
+        self.tickets.edit_tickets(uids, ticket_names, ticket_totals)
+        rows = self.tickets.rows_of(uids)
+        self.dataChanged.emit(self.index(int(rows.min()), 0),
+                              self.index(int(rows.max()), len(COLUMNS) - 1))
+        self._summary_changed()
+
+    def clear(self) -> None:
+        """
+        Removes all the tickets.
+        """
+        self.beginResetModel()
+        self.tickets.clear_data()
+        self.endResetModel()
+
+    def refresh(self) -> None:
+        """
+        Resets the view, used after the tickets were replaced as a whole (e.g.
+        when a record is fetched).
+        """
+        self.beginResetModel()
+        self.endResetModel()
+
+    def set_tickets(self, tickets:Tickets) -> None:
+        """Shows the given tickets instead of the current ones.
+
+        Args:
+            tickets (Tickets): New tickets
+        """
+        self.beginResetModel()
+        self.tickets = tickets
+        self.endResetModel()
+
+
+class RecordsModel(QAbstractTableModel):
+    """
+    Table model for the records explorer. The records are streamed from the
+    database in pages as the user scrolls (canFetchMore/fetchMore), using
+    keyset pagination on the records ID. Only the cells shown by the view are
+    formatted. While a search is set, only the matching records are streamed,
+    with an extra column showing the hits. The pages are read on the
+    database thread, the rows are inserted once a page arrives.
+    """
+    HEADERS = ("ID", "Registro", "Fecha de guardado", "Fecha de modificacion",
+               "Tickets", "Total", "Sub-Total", "IVA")
+    SEARCH_HEADER = "Coincidencias"
+    PAGE_SIZE = 200
+
+    def __init__(self, records:Records, database_queue:DatabaseQueue):
+        super().__init__()
+        self.records = records
+        self.database_queue = database_queue
+        self.rows = []
+        self.exhausted = False
+        self.loading = False
+        self.generation = 0 # Pages requested before a reset are dropped
+        self.search_text = ""
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS) + 1 if self.search_text else len(self.HEADERS)
+
+    def headerData(self, section:int, orientation:Qt.Orientation,
+                   role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and \
+            orientation == Qt.Orientation.Horizontal:
+            if section == len(self.HEADERS):
+                return self.SEARCH_HEADER
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index:QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        value = self.rows[index.row()][index.column()]
+        if index.column() == len(self.HEADERS): # Search hits
+            return value
+        if index.column() >= 5: # Money columns
+            return f"{value:.2f}"
+        if index.column() in (2, 3): # Dates
+            return self.format_date(value)
+        return str(value)
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        if parent.isValid():
+            return False
+        return not self.exhausted and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()) -> None:
+        if parent.isValid() or self.exhausted or self.loading:
+            return
+        self.loading = True
+        generation = self.generation
+        last_id = self.rows[-1][0] if self.rows else FIRST_PAGE
+        if self.search_text:
+            request = (self.records.search, self.search_text, last_id,
+                       self.PAGE_SIZE)
+        else:
+            request = (self.records.fetch_page, last_id, self.PAGE_SIZE)
+        self.database_queue.submit(*request, message="Cargando registros...",
+                                   on_done=lambda page:
+                                       self._page_loaded(generation, page))
+
+    def _page_loaded(self, generation:int, page:list) -> None:
+        """Inserts the rows of a page read by the database thread, unless the
+        model was reset after it was requested.
+
+        Args:
+            generation (int): Generation of the model when it was requested
+            page (list): Rows of the page
+        """
+        if generation != self.generation:
+            return
+        self.loading = False
+        self.exhausted = len(page) < self.PAGE_SIZE
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows),
+                                 len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    @staticmethod
+    def format_date(value) -> str:
+        """Formats an ISO-8601 date of the records table for display.
+
+        Args:
+            value (str | None): Stored date, a timestamp or just a date (the
+                records saved before timestamps were stored)
+
+        Returns:
+            str: Date as 'dd/mm/YYYY HH:MM', or 'dd/mm/YYYY' if it has no time
+        """
+        if not value:
+            return ""
+        if len(value) == 10:
+            return datetime.strptime(value, "%Y-%m-%d").strftime("%d/%m/%Y")
+        return datetime.strptime(value, DATE_FORMAT).strftime("%d/%m/%Y %H:%M")
+
+    def record_name(self, row:int) -> str:
+        """Returns the name of the record at the given row.
+
+        Args:
+            row (int): Row of the record
+
+        Returns:
+            str: Name of the record
+        """
+        return self.rows[row][1]
+
+    def refresh(self) -> None:
+        """
+        Drops the loaded pages, the view fetches the first page again.
+        """
+        self.beginResetModel()
+        self.rows = []
+        self.exhausted = False
+        self.loading = False
+        self.generation += 1
+        self.endResetModel()
+
+    def set_search(self, text:str) -> None:
+        """Shows only the records matching the given text (see
+        'Records.search'), or all of them if it's empty.
+
+        Args:
+            text (str): Words to search
+        """
+        self.beginResetModel()
+        self.search_text = text.strip()
+        self.rows = []
+        self.exhausted = False
+        self.loading = False
+        self.generation += 1
+        self.endResetModel()
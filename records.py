@@ -1,79 +1,133 @@
-import sqlite3 as db
-from os import environ, path, mkdir
 from time import strftime
+from re import findall, sub
+from unicodedata import normalize, combining
+from datetime import date, datetime
 import pandas as pd
+from database import get_database
+from migrations import RECORD_SUMMARY, UPDATE_SUMMARY
+from tickets import Tickets
 
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S" # ISO-8601, sorts as text
+DATE_COLUMNS = ("DateC", "DateM")
+HIGHLIGHT = ("[", "]") # Marks around the matched words of the search hits
+SEARCH_HITS = 5 # Ticket hits shown for each record found by a search
+SEARCH_TERMS = 64 # Words a searched prefix can be expanded into
+INDEXED_PREFIX = 3 # Longest prefix indexed by tickets_search
+FIRST_PAGE = (1 << 31) - 1 # Keyset of the first page, above any record ID
+
+
+def fold_text(text:str) -> str:
+    """Folds the given text like the tokenizer of the search indexes, that is
+    lower case and without diacritics.
+
+    Args:
+        text (str): Text to fold
+
+    Returns:
+        str: Folded text
+    """
+    return "".join(char for char in normalize("NFKD", text.lower())
+                   if not combining(char))
+
+
+def search_words(text:str) -> list:
+    """Splits the given search text into folded words.
+
+    Args:
+        text (str): Text to search
+
+    Returns:
+        list: Folded words
+    """
+    return findall(r"\w+", fold_text(text))
+
+
+def highlight(text:str, words:list) -> str:
+    """Marks (with HIGHLIGHT) the words of the given text which start with
+    any of the searched words.
+
+    Args:
+        text (str): Text of a hit
+        words (list): Folded searched words
+
+    Returns:
+        str: Text with the matching words highlighted
+    """
+    return sub(r"\w+", lambda match: HIGHLIGHT[0] + match[0] + HIGHLIGHT[1]
+               if fold_text(match[0]).startswith(tuple(words)) else match[0],
+               text)
 
-DIRECTORY = environ["USERPROFILE"] + "\\.tickets"
-if not path.exists(DIRECTORY):
-    mkdir(DIRECTORY)
-    
     
 class Records():
     def __init__(self) -> None:
-        self.db_file = DIRECTORY + "\\records.db"
-        self.create_table()
+        self.db = get_database()
         
-    def create_table(self) -> None:
-        """
-        Creates the records table. With the following columns:
-        - ID (primary key -> Int)
-        - Name (-> Text)
-        - DateC (Creation date-> Text)
-        - DateM (Modification date -> Text)
-        - Tickets (Number of tickets -> Integer)
-        - Total (Sum of the totals -> Real)
-        - SubTotal (Sum of the Sub-Totals -> Real)
-        - IVA (Sum of the taxes -> Real)
+    def save_record(self, tickets:Tickets, name:str) -> None:
+        """Saves the given tickets as the record with the given name. The
+        record row in the 'records' table and the tickets are written in a
+        single transaction, so one can't be saved without the other. The
+        summary columns of the record are refreshed from its tickets in the
+        same transaction (see 'refresh_summary'). The tickets are marked as
+        saved only once the transaction is committed.
+
+        Args:
+            tickets (Tickets): Tickets of the record
+            name (str): Name of the record
         """
-        conn = db.connect(self.db_file)
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM sqlite_master WHERE name=='records'")
-        if cur.fetchone() is None:
-            cur.execute("CREATE TABLE records(ID INTEGER PRIMARY KEY,"\
-                                                "Name TEXT,"\
-                                                "DateC TEXT,"\
-                                                "DateM TEXT,"\
-                                                "Tickets INTEGER,"\
-                                                "Total REAL,"\
-                                                "SubTotal REAL,"\
-                                                "IVA REAL)")
-        cur.close()
-        conn.close()
+        with self.db.transaction():
+            record_id = self.add_record(name)
+            tickets.save_record(record_id)
+            self.refresh_summary(record_id)
+        tickets.mark_saved(record_id)
         
-    def add_record(self, data:pd.DataFrame, name:str) -> None:
-        """Adds the given record of ticket to the table 'records', adding the 
-        Creation and Modification date (Depends if the record already exists)
+    def add_record(self, name:str) -> int:
+        """Adds the record with the given name to the table 'records', in a
+        single upsert on its unique name. A new record gets its creation date
+        and an empty summary, until its tickets are saved. If the record
+        already exists, only its modification date is set. Both dates are
+        ISO-8601 timestamps.
 
         Args:
-            data (DataFrame): Tickets data
             name (str): Name of the record
+            
+        Returns:
+            int: ID of the record
         """
-        now_date = strftime("%d/%m/%Y")
-        tickets = len(data)
-        total = round(data["Total"].sum(), 2)
-        sub_total = round(data["Sub-Total"].sum(), 2)
-        iva = round(data["IVA"].sum(), 2)
-        
-        conn = db.connect(self.db_file)
-        cur = conn.cursor()
-        
-        if self.record_exists(name):
-            cur.execute("UPDATE records SET DateM=?, Tickets=?, Total=?, SubTotal=?, IVA=?" \
-                        "WHERE Name=?", (now_date, tickets, total, sub_total, iva, name))
-            conn.commit()
-            cur.close()
-            conn.close()
-        else:
-            cur.execute("INSERT INTO records(Name, DateC, DateM, Tickets, Total, SubTotal, IVA)" \
-                        "VALUES (?,?,?,?,?,?,?)", (name, now_date, "", 
-                                                   tickets, total, sub_total, iva))
-            conn.commit()
-            cur.close()
-            conn.close()
+        now_date = strftime(DATE_FORMAT)
+        cur = self.db.execute("INSERT INTO records(Name, DateC, DateM, Tickets, "\
+                              "Total, SubTotal, IVA) VALUES (?,?,NULL,0,0,0,0) "\
+                              "ON CONFLICT(Name) DO UPDATE SET DateM=excluded.DateC "\
+                              "RETURNING ID",
+                              (name, now_date))
+        return cur.fetchone()[0]
+
+    def refresh_summary(self, record_id:int) -> None:
+        """Recomputes the summary columns (Tickets, Total, SubTotal and IVA) of
+        the given record from its tickets, a single update which reads them
+        through the primary key of the tickets table.
+
+        Args:
+            record_id (int): ID of the record
+        """
+        self.db.execute(f"{UPDATE_SUMMARY} WHERE ID=?", (record_id,))
+
+    def verify_aggregates(self) -> int:
+        """Rebuilds the summary columns (Tickets, Total, SubTotal and IVA) of
+        the records which don't match their tickets, in a single bulk update.
+        The stored summaries are computed with the same expressions, so a
+        record which is up to date compares equal.
+
+        Returns:
+            int: Number of records which were rebuilt
+        """
+        with self.db.transaction() as conn:
+            cur = conn.execute(f"{UPDATE_SUMMARY} WHERE (Tickets, Total, "\
+                               f"SubTotal, IVA) IS NOT ({RECORD_SUMMARY})")
+            return cur.rowcount
     
     def record_exists(self, name:str):
-        """Checks if the given record name exists in the 'records' table
+        """Checks if the given record name exists in the 'records' table, it's
+        an EXISTS probe on the unique index of the names.
 
         Args:
             name (str): Name of the record
@@ -81,48 +135,188 @@ class Records():
         Returns:
             bool: True if the records exists, False if it doesn't
         """
-        conn = db.connect(self.db_file)
-        cur = conn.cursor()
-        cur.execute("SELECT Name from records WHERE Name==(?)", (name,))
-        if cur.fetchone() is None:
-            return False
-        else:
-            return True
+        cur = self.db.execute("SELECT EXISTS(SELECT 1 FROM records WHERE Name==?)",
+                              (name,))
+        return bool(cur.fetchone()[0])
         
-    def load_records(self) -> None:
+    def query(self, date_from=None, date_to=None,
+              date_column:str="DateC") -> pd.DataFrame:
+        """Loads the records whose date falls in the given range, both ends
+        included, ordered by that date. The range is resolved by the index of
+        the date column, so only the matching records are read.
+
+        Args:
+            date_from (str | date | datetime, optional): Start of the range, an
+                ISO-8601 date or timestamp. Defaults to None (no lower bound).
+            date_to (str | date | datetime, optional): End of the range. A
+                date without time includes the whole day. Defaults to None
+                (no upper bound).
+            date_column (str, optional): "DateC" (creation date) or "DateM"
+                (modification date). Defaults to "DateC".
+
+        Raises:
+            ValueError: If the date column doesn't exist
+
+        Returns:
+            pd.DataFrame: Matching rows of the 'records' table
         """
-        Loads the records table into the variable data.
+        if date_column not in DATE_COLUMNS:
+            raise ValueError(f"Unknown date column: {date_column}")
+        conditions, params = [], []
+        if date_from is not None:
+            conditions.append(f"{date_column} >= ?")
+            params.append(self._iso_date(date_from))
+        if date_to is not None:
+            date_to = self._iso_date(date_to)
+            if len(date_to) == 10: # Whole day
+                conditions.append(f"{date_column} < date(?, '+1 day')")
+            else:
+                conditions.append(f"{date_column} <= ?")
+            params.append(date_to)
+        where = " AND ".join(conditions) or f"{date_column} IS NOT NULL"
+        return pd.read_sql_query(f"SELECT * FROM records WHERE {where} "\
+                                 f"ORDER BY {date_column}",
+                                 self.db.connection, params=params)
+
+    @staticmethod
+    def _iso_date(value) -> str:
+        """Converts a date or timestamp into the ISO-8601 text stored in the
+        date columns.
+
+        Args:
+            value (str | date | datetime): Date, strings must be ISO-8601
+
+        Returns:
+            str: ISO-8601 date ('YYYY-MM-DD') or timestamp
         """
-        conn = db.connect(self.db_file)
-        self.data = pd.read_sql_query("SELECT * FROM records", conn)
-        conn.close()
+        if isinstance(value, datetime):
+            return value.strftime(DATE_FORMAT)
+        if isinstance(value, date):
+            return value.isoformat()
+        return str(value).replace("T", " ")
 
-    def remove_record(self, record_name:str) -> None:
-        """Removes the given record from the database and also from the records 
-        table.
+    def fetch_page(self, before_id:int, limit:int) -> list:
+        """Fetch a page of records using keyset pagination, newest first,
+        that is the records with an ID lower than the given one, ordered by
+        descending ID.
 
         Args:
-            record_name (str): Name of the record to be removed.
+            before_id (int): ID of the last record of the previous page, or
+                FIRST_PAGE for the first one
+            limit (int): Maximum number of records to fetch
+
+        Returns:
+            list: Rows (tuples) of the 'records' table
         """
-        conn = db.connect(self.db_file)
-        cur = conn.cursor()
-        cur.execute(f"DROP TABLE '{record_name}'")
-        cur.execute("DELETE FROM 'records' WHERE Name==?", (record_name,))
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-    def fetch_all_names(self) -> list:
-        """Fetch the names registered in the records table
+        cur = self.db.execute("SELECT * FROM records WHERE ID < ? "\
+                              "ORDER BY ID DESC LIMIT ?", (before_id, limit))
+        return cur.fetchall()
+
+    def search(self, text:str, before_id:int=FIRST_PAGE, limit:int=200) -> list:
+        """Full-text search of the given words in the record names and the
+        ticket names (see the FTS5 indexes created by the migrations). Each
+        word matches as a prefix and all of them must be found in the same
+        name. The results are paged like 'fetch_page'.
+
+        Args:
+            text (str): Words to search
+            before_id (int, optional): ID of the last record of the previous
+                page. Defaults to FIRST_PAGE.
+            limit (int, optional): Maximum number of records to fetch.
+                Defaults to 200.
+
+        Returns:
+            list: Rows (tuples) of the 'records' table with an extra column,
+                the hits of the record with the matched words highlighted
+        """
+        words = search_words(text)
+        if not words:
+            return []
+        cur = self.db.execute("SELECT rowid FROM records_search WHERE "\
+                              "records_search MATCH ? AND rowid < ? "\
+                              "ORDER BY rowid DESC LIMIT ?",
+                              (" ".join(f'"{word}"*' for word in words),
+                               before_id, limit))
+        name_hits = {record_id for (record_id,) in cur}
+        ticket_hits = {}
+        match = self._tickets_match_query(words)
+        end = before_id << 32
+        while match and len(ticket_hits) < limit:
+            # Seek the previous record with hits, then read its first hits
+            cur = self.db.execute("SELECT rowid FROM tickets_search WHERE "\
+                                  "tickets_search MATCH ? AND rowid < ? "\
+                                  "ORDER BY rowid DESC LIMIT 1", (match, end))
+            key = cur.fetchone()
+            if key is None:
+                break
+            record_id = key[0] >> 32
+            if len(name_hits) == limit and record_id < min(name_hits):
+                break
+            end = record_id << 32
+            cur = self.db.execute("SELECT name FROM tickets_search WHERE "\
+                                  "tickets_search MATCH ? AND rowid >= ? "\
+                                  "AND rowid < ? ORDER BY rowid LIMIT ?",
+                                  (match, end, end + (1 << 32), SEARCH_HITS + 1))
+            ticket_hits[record_id] = [name for (name,) in cur]
+        record_ids = sorted(name_hits | ticket_hits.keys(), reverse=True)[:limit]
+        cur = self.db.execute("SELECT * FROM records WHERE ID IN "\
+                              f"({','.join('?' * len(record_ids))}) "\
+                              "ORDER BY ID DESC", record_ids)
+        rows = []
+        for row in cur:
+            hits = [row[1]] if row[0] in name_hits else []
+            hits.extend(ticket_hits.get(row[0], [])[:SEARCH_HITS])
+            hits = [highlight(hit, words) for hit in hits]
+            if len(ticket_hits.get(row[0], [])) > SEARCH_HITS:
+                hits.append("...")
+            rows.append((*row, ", ".join(hits)))
+        return rows
+
+    def _tickets_match_query(self, words:list) -> str:
+        """Builds the FTS5 query of the given words for the tickets index.
+        Short words are searched in the prefix index, longer ones are
+        expanded into the indexed words they are a prefix of, so the index can
+        seek the hits instead of reading all of them, unless they are the
+        prefix of too many words (SEARCH_TERMS).
+
+        Args:
+            words (list): Folded words to search (see 'search_words')
 
         Returns:
-            list: List of names registered on the record table
+            str: FTS5 query, empty if a word can't be found
+        """
+        parts = []
+        for word in words:
+            if len(word) <= INDEXED_PREFIX:
+                parts.append(f'"{word}"*')
+                continue
+            cur = self.db.execute("SELECT term FROM tickets_search_terms "\
+                                  "WHERE term >= ? AND term < ? LIMIT ?",
+                                  (word, word[:-1] + chr(ord(word[-1]) + 1),
+                                   SEARCH_TERMS + 1))
+            terms = [term for (term,) in cur]
+            if not terms:
+                return ""
+            if len(terms) > SEARCH_TERMS:
+                parts.append(f'"{word}"*')
+            else:
+                parts.append("(" + " OR ".join(f'"{term}"' for term in terms) + ")")
+        return " AND ".join(parts)
+
+    def remove_record(self, record_name:str) -> None:
+        """Removes the tickets of the given record from the database (and the
+        search index) and also the record from the records table.
+
+        Args:
+            record_name (str): Name of the record to be removed.
         """
-        conn = db.connect(self.db_file)
-        cur = conn.cursor()
-        cur.execute("SELECT Name FROM records")
-        names = cur.fetchall()
-        cur.close()
-        conn.close()
-        names = [item[0] for item in names]
-        return names
\ No newline at end of file
+        with self.db.transaction() as conn:
+            cur = conn.execute("DELETE FROM records WHERE Name==? RETURNING ID",
+                               (record_name,))
+            row = cur.fetchone()
+            if row is None:
+                return
+            record_id = row[0]
+            conn.execute("DELETE FROM tickets WHERE record_id=?", (record_id,))
+            conn.execute("DELETE FROM tickets_search WHERE rowid >= ? AND rowid < ?",
+                         (record_id << 32, (record_id + 1) << 32))
@@ -1,18 +1,304 @@
+import numpy as np
 import pandas as pd
-import sqlite3 as db
-from os import environ, path, mkdir
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import repeat
+from database import get_database
+
+COLUMNS = ["ID", "Ticket", "Total", "Sub-Total", "IVA"]
+INITIAL_CAPACITY = 64
+FIRST_CHUNK = 256 # Rows of the first chunk of a streamed record (first screen)
+MAX_CHUNK = 16384 # The chunks double up to this number of rows
+IVA_RATE = 16 # Percentage
+CENT = Decimal("0.01")
+
+
+def parse_amount(text:str) -> Decimal:
+    """Parses an amount typed by the user, rounded half up to the cent in
+    decimal arithmetic, so the result doesn't depend on the binary
+    representation of the typed number (e.g. '2.675' -> 2.68).
+
+    Args:
+        text (str): Amount in pesos
+
+    Returns:
+        Decimal: Amount in pesos, with two decimals
+    """
+    return Decimal(text).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_cents(amount):
+    """Converts an amount (or an array of amounts) to integer cents. Floats
+    are rounded to the nearest cent, the amounts typed by the user should
+    be parsed with 'parse_amount' first.
+
+    Args:
+        amount (float | Decimal | ArrayLike): Amount in pesos
+
+    Returns:
+        int | np.ndarray: Amount in cents
+    """
+    if isinstance(amount, Decimal):
+        return int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+    if np.ndim(amount) == 0:
+        return int(round(float(amount) * 100))
+    return np.rint(np.asarray(amount, dtype=np.float64) * 100).astype(np.int64)
+
+
+def split_tax(total_cents):
+    """Splits a total (or an array of totals) in cents into its Sub-Total and
+    IVA. The Sub-Total is rounded half up to the cent and the IVA is the 
+    remainder, so Sub-Total + IVA always equals the Total exactly.
+
+    Args:
+        total_cents (int | np.ndarray): Total in cents
+
+    Returns:
+        tuple: Sub-Total and IVA in cents
+    """
+    divisor = 2 * (100 + IVA_RATE)
+    sub_total = (total_cents * 200 + 100 + IVA_RATE) // divisor
+    return sub_total, total_cents - sub_total
+
+
+def format_cents(cents):
+    """Formats an amount (or an array of amounts) in cents as a string with
+    two decimals.
+
+    Args:
+        cents (int | np.ndarray): Amount in cents
+
+    Returns:
+        str | np.ndarray: Formatted amount, e.g. '1234.50'
+    """
+    if np.ndim(cents) == 0:
+        sign = "-" if cents < 0 else ""
+        pesos, cents = divmod(abs(int(cents)), 100)
+        return f"{sign}{pesos}.{cents:02d}"
+    cents = np.asarray(cents, dtype=np.int64)
+    pesos, rest = np.divmod(np.abs(cents), 100)
+    signed = np.char.add(np.where(cents < 0, "-", ""), pesos.astype(str))
+    return np.char.add(np.char.add(signed, "."), np.char.zfill(rest.astype(str), 2))
 
-DIRECTORY = environ["USERPROFILE"] + "\\.tickets"
-if not path.exists(DIRECTORY):
-    mkdir(DIRECTORY)
 
 class Tickets():
+    """
+    Column store for the tickets. Each column lives in its own NumPy array
+    which grows by doubling its capacity, so adding a ticket has an amortized
+    constant cost. The amounts are kept as integer cents, they're only
+    converted to pesos by the 'data' DataFrame, which is built when requested.
+    
+    Every ticket gets a stable ID (uid) which never changes while the ticket
+    exists. Removed tickets are only marked as deleted (tombstones) and the
+    arrays are compacted once the deleted rows outnumber the live ones, the
+    consecutive IDs shown to the user are computed by the view.
+    
+    The changes made since the record was fetched (or last saved) are tracked
+    so only them are written when it's saved again: the tickets with a uid 
+    from '_saved_uid' on were inserted, and the '_edited' and '_deleted' sets
+    hold the uids of the saved tickets that were edited or removed.
+    """
     def __init__(self) -> None:
-        self.data = pd.DataFrame(columns=["ID", "Ticket", "Total", "Sub-Total", "IVA"])
-        self.data["ID"] = self.data.index
-        self.db_file = DIRECTORY + "\\records.db"
+        self.db = get_database()
+        self.clear_data()
+        
+    def __len__(self) -> int:
+        return self._count
+        
+    @property
+    def data(self) -> pd.DataFrame:
+        """DataFrame view of the tickets (ID, Ticket, Total, Sub-Total, IVA).
+        The view is built lazily and cached until the tickets are modified.
+
+        Returns:
+            pd.DataFrame: Tickets data
+        """
+        if self._frame is None:
+            rows = self._rows()
+            self._frame = pd.DataFrame({"ID": np.arange(1, len(rows)+1),
+                                        "Ticket": self._names[rows],
+                                        "Total": self._totals[rows] / 100,
+                                        "Sub-Total": self._sub_totals[rows] / 100,
+                                        "IVA": self._ivas[rows] / 100},
+                                       index=range(1, len(rows)+1),
+                                       columns=COLUMNS)
+        return self._frame
+    
+    @property
+    def uids(self) -> np.ndarray:
+        """Stable IDs of the tickets, in display order.
+
+        Returns:
+            np.ndarray: Ticket uids
+        """
+        return self._uids[self._rows()]
+    
+    @property
+    def summary_cents(self) -> tuple:
+        """Running totals of the tickets.
+
+        Returns:
+            tuple: Sum of the Total, Sub-Total and IVA in cents
+        """
+        return self._sum_total, self._sum_sub_total, self._sum_iva
+    
+    def iter_chunks(self, chunk_size:int=MAX_CHUNK):
+        """Iterates over the tickets in display order, in chunks of column
+        slices, so they can be written without building a copy of the whole
+        store.
+
+        Args:
+            chunk_size (int, optional): Tickets of each chunk. Defaults to
+                MAX_CHUNK.
+
+        Yields:
+            tuple: IDs shown to the user, names, totals, sub-totals and IVA
+                arrays of a chunk (amounts in cents)
+        """
+        rows = self._rows()
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            yield (np.arange(start + 1, start + len(chunk) + 1),
+                   self._names[chunk],
+                   self._totals[chunk],
+                   self._sub_totals[chunk],
+                   self._ivas[chunk])
+    
+    def snapshot(self) -> "Tickets":
+        """Copies the live tickets, in display order, into a new store which
+        isn't linked to any record. The copy doesn't change when these
+        tickets are modified, so it can be read by another thread (e.g. while
+        it's exported).
+
+        Returns:
+            Tickets: Copy of the tickets
+        """
+        rows = self._rows()
+        tickets = Tickets()
+        tickets._append(self._names[rows], self._totals[rows],
+                        self._sub_totals[rows], self._ivas[rows])
+        return tickets
+    
+    def uid_at(self, row:int) -> int:
+        """Returns the stable ID of the ticket displayed at the given row.
+
+        Args:
+            row (int): Zero-based row of the ticket in display order
+
+        Returns:
+            int: Ticket uid
+        """
+        return int(self._uids[self._rows()[row]])
+    
+    def rows_of(self, uids) -> np.ndarray:
+        """Returns the display rows of the tickets with the given uids.
+
+        Args:
+            uids (Sequence[int]): Ticket uids
+
+        Returns:
+            np.ndarray: Zero-based rows of the tickets in display order
+        """
+        return np.searchsorted(self.uids, np.asarray(uids, dtype=np.int64))
+    
+    def ticket_at(self, row:int) -> tuple:
+        """Returns the values of the ticket displayed at the given row, read
+        straight from the column arrays.
+
+        Args:
+            row (int): Zero-based row of the ticket in display order
+
+        Returns:
+            tuple: uid, name, total, sub-total and IVA (amounts in cents)
+        """
+        slot = self._rows()[row]
+        return (int(self._uids[slot]), self._names[slot], int(self._totals[slot]),
+                int(self._sub_totals[slot]), int(self._ivas[slot]))
+    
+    def _rows(self) -> np.ndarray:
+        """Positions in the arrays of the live tickets, in display order. They
+        are computed lazily and cached until a ticket is added or removed.
+
+        Returns:
+            np.ndarray: Array positions of the live tickets
+        """
+        if self._order is None:
+            self._order = np.flatnonzero(self._alive[:self._size])
+        return self._order
+    
+    def _slot(self, uid:int) -> int:
+        """Finds the array position of the ticket with the given uid. The uids
+        are always increasing along the arrays, so a binary search is enough.
+
+        Args:
+            uid (int): Ticket uid
+
+        Raises:
+            KeyError: If there is no ticket with the given uid
+
+        Returns:
+            int: Array position of the ticket
+        """
+        slot = int(np.searchsorted(self._uids[:self._size], uid))
+        if slot == self._size or self._uids[slot] != uid or not self._alive[slot]:
+            raise KeyError(f"There is no ticket with ID {uid}")
+        return slot
+        
+    def _slots(self, uids) -> np.ndarray:
+        """Vectorized version of '_slot', finds the array positions of the
+        tickets with the given uids.
+
+        Args:
+            uids (Sequence[int]): Ticket uids
+
+        Raises:
+            KeyError: If any of the uids doesn't belong to a ticket
+
+        Returns:
+            np.ndarray: Array positions of the tickets
+        """
+        uids = np.unique(np.asarray(uids, dtype=np.int64))
+        slots = np.searchsorted(self._uids[:self._size], uids)
+        found = slots < self._size
+        found[found] &= self._uids[slots[found]] == uids[found]
+        found[found] &= self._alive[slots[found]]
+        if not found.all():
+            raise KeyError(f"There are no tickets with IDs {uids[~found].tolist()}")
+        return slots
         
-    def add_ticket(self, ticket_name:str, ticket_total:float):
+    def _reserve(self, size:int) -> None:
+        """Makes sure the column arrays can hold at least the given number of
+        rows, doubling their capacity when they are full.
+
+        Args:
+            size (int): Number of rows the arrays must be able to hold
+        """
+        capacity = len(self._names)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for column in ("_uids", "_alive", "_names", "_totals", "_sub_totals",
+                       "_ivas"):
+            old = getattr(self, column)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, column, new)
+            
+    def _compact(self) -> None:
+        """
+        Drops the deleted rows from the arrays, keeping the display order.
+        """
+        rows = self._rows()
+        count = len(rows)
+        for column in ("_uids", "_alive", "_names", "_totals", "_sub_totals",
+                       "_ivas"):
+            array = getattr(self, column)
+            array[:count] = array[rows]
+        self._names[count:self._size] = None
+        self._size = count
+        self._order = None
+            
+    def add_ticket(self, ticket_name:str, ticket_total:float) -> int:
         """
         Adds a new ticket to the dataframe, automatically calculates the
         Sub-Total and IVA columns.
@@ -20,73 +306,363 @@ class Tickets():
         Args:
             ticket_name (str): Name of the ticket
             ticket_total (float): Total amount of the ticket
+            
+        Returns:
+            int: uid of the new ticket
+        """
+        total = to_cents(ticket_total)
+        sub_total, iva = split_tax(total)
+        self._reserve(self._size + 1)
+        row, uid = self._size, self._next_uid
+        self._uids[row] = uid
+        self._alive[row] = True
+        self._names[row] = ticket_name
+        self._totals[row] = total
+        self._sub_totals[row] = sub_total
+        self._ivas[row] = iva
+        self._size += 1
+        self._count += 1
+        self._next_uid += 1
+        self._update_sums(total, sub_total, iva)
+        self._order = self._frame = None
+        return uid
+        
+    def add_tickets(self, ticket_names, ticket_totals) -> np.ndarray:
+        """
+        Adds a batch of tickets at once. The Sub-Total and IVA columns are
+        calculated for the whole batch in a single vectorized pass.
+
+        Args:
+            ticket_names (Sequence[str]): Names of the tickets
+            ticket_totals (Sequence[float]): Total amounts of the tickets
+            
+        Returns:
+            np.ndarray: uids of the new tickets
         """
-        sub_total = round(ticket_total / 1.16, 2)
-        iva = round(sub_total * 0.16, 2)
-        self.data.loc[len(self.data)+1] = [len(self.data)+1, ticket_name,
-                                           ticket_total, sub_total, iva]
+        names = np.asarray(ticket_names, dtype=object)
+        totals = to_cents(np.asarray(ticket_totals, dtype=np.float64))
+        if names.shape != totals.shape or names.ndim != 1:
+            raise ValueError("ticket_names and ticket_totals must be "\
+                             "one-dimensional and of the same length")
+        sub_totals, ivas = split_tax(totals)
+        return self._append(names, totals, sub_totals, ivas)
         
-    def remove_ticket(self, index:int):
-        """Removes the row at the given index, and update the index and ID
-        column for all the rows.
+    def _append(self, names:np.ndarray, totals:np.ndarray,
+                sub_totals:np.ndarray, ivas:np.ndarray,
+                uids:np.ndarray=None) -> np.ndarray:
+        """Copies the given column arrays at the end of the store, assigning
+        the uids of the new tickets in one step.
 
         Args:
-            index (int): index to be removed from the dataframe
+            names (np.ndarray): Names of the tickets
+            totals (np.ndarray): Totals of the tickets in cents
+            sub_totals (np.ndarray): Sub-Totals of the tickets in cents
+            ivas (np.ndarray): IVA of the tickets in cents
+            uids (np.ndarray, optional): uids of the tickets, they must be 
+                increasing and greater than the existing ones. Defaults to
+                None, which assigns the next available uids.
+            
+        Returns:
+            np.ndarray: uids of the new tickets
         """
-        self.data = self.data.drop(index)
-        self.data.index = range(1,len(self.data)+1)
-        self.data["ID"] = self.data.index
+        start, count = self._size, len(names)
+        end = start + count
+        self._reserve(end)
+        if uids is None:
+            uids = np.arange(self._next_uid, self._next_uid + count, dtype=np.int64)
+        self._uids[start:end] = uids
+        self._alive[start:end] = True
+        self._names[start:end] = names
+        self._totals[start:end] = totals
+        self._sub_totals[start:end] = sub_totals
+        self._ivas[start:end] = ivas
+        self._size = end
+        self._count += count
+        if count:
+            self._next_uid = int(uids[-1]) + 1
+        self._update_sums(totals.sum(), sub_totals.sum(), ivas.sum())
+        self._order = self._frame = None
+        return uids
         
-    def edit_ticket(self, index:int, ticket_name:str, ticket_total:float):
-        """Edits the row at the given index with the provided user data. Also
-        updates the Sub-Total and IVA.
+    def remove_ticket(self, uid:int):
+        """Removes the ticket with the given uid. The ticket is only marked as
+        deleted, the IDs shown to the user are recomputed by the view.
 
         Args:
-            index (int): Index of the row to be edited
+            uid (int): uid of the ticket to be removed
+        """
+        slot = self._slot(uid)
+        self._update_sums(-self._totals[slot], -self._sub_totals[slot],
+                          -self._ivas[slot])
+        if uid < self._saved_uid:
+            self._edited.discard(uid)
+            self._deleted.add(uid)
+        self._alive[slot] = False
+        self._names[slot] = None
+        self._count -= 1
+        self._order = self._frame = None
+        if self._size - self._count > max(self._count, INITIAL_CAPACITY):
+            self._compact()
+        
+    def remove_tickets(self, uids):
+        """Removes all the tickets with the given uids in a single vectorized
+        pass.
+
+        Args:
+            uids (Sequence[int]): uids of the tickets to be removed
+        """
+        slots = self._slots(uids)
+        self._update_sums(-self._totals[slots].sum(),
+                          -self._sub_totals[slots].sum(),
+                          -self._ivas[slots].sum())
+        saved = self._uids[slots]
+        saved = saved[saved < self._saved_uid].tolist()
+        self._edited.difference_update(saved)
+        self._deleted.update(saved)
+        self._alive[slots] = False
+        self._names[slots] = None
+        self._count -= len(slots)
+        self._order = self._frame = None
+        if self._size - self._count > max(self._count, INITIAL_CAPACITY):
+            self._compact()
+        
+    def edit_ticket(self, uid:int, ticket_name:str, ticket_total:float):
+        """Edits the ticket with the given uid with the provided user data.
+        Also updates the Sub-Total and IVA.
+
+        Args:
+            uid (int): uid of the ticket to be edited
             ticket_name (str): Name of the ticket
             ticket_total (float): Total amount of the ticket
         """
-        sub_total = round(ticket_total / 1.16, 2)
-        iva = round(sub_total * 0.16, 2)
-        self.data.loc[index] = (index, ticket_name, ticket_total, sub_total, iva)
+        slot = self._slot(uid)
+        if uid < self._saved_uid:
+            self._edited.add(uid)
+        total = to_cents(ticket_total)
+        sub_total, iva = split_tax(total)
+        self._update_sums(total - self._totals[slot],
+                          sub_total - self._sub_totals[slot],
+                          iva - self._ivas[slot])
+        self._names[slot] = ticket_name
+        self._totals[slot] = total
+        self._sub_totals[slot] = sub_total
+        self._ivas[slot] = iva
+        self._frame = None
         
-    def calculate_summary(self):
+    def edit_tickets(self, uids, ticket_names=None, ticket_totals=None):
+        """Edits all the tickets with the given uids in a single vectorized
+        pass. A single name or total is applied to every ticket, and the
+        column is left unchanged when it's None.
+
+        Args:
+            uids (Sequence[int]): uids of the tickets to be edited
+            ticket_names (str | Sequence[str], optional): New names of the
+                tickets. Defaults to None.
+            ticket_totals (float | Sequence[float], optional): New total
+                amounts of the tickets. Defaults to None.
         """
-        Calculates the sum of the current tickets data, assigning it to the 
-        "summary" variable of the object.
-        And formats the values to fit the main window table.
+        uids = np.asarray(uids, dtype=np.int64)
+        order = np.argsort(uids)
+        slots = self._slots(uids)
+        if len(slots) != len(uids):
+            raise ValueError("uids must not contain duplicates")
+        self._edited.update(uids[uids < self._saved_uid].tolist())
+        if ticket_names is not None:
+            names = np.empty(len(uids), dtype=object)
+            names[:] = ticket_names if isinstance(ticket_names, str) \
+                else np.asarray(ticket_names, dtype=object)
+            self._names[slots] = names[order]
+        if ticket_totals is not None:
+            totals = to_cents(np.broadcast_to(np.asarray(ticket_totals,
+                                                         dtype=np.float64),
+                                              uids.shape))[order]
+            sub_totals, ivas = split_tax(totals)
+            self._update_sums(totals.sum() - self._totals[slots].sum(),
+                              sub_totals.sum() - self._sub_totals[slots].sum(),
+                              ivas.sum() - self._ivas[slots].sum())
+            self._totals[slots] = totals
+            self._sub_totals[slots] = sub_totals
+            self._ivas[slots] = ivas
+        self._frame = None
+        
+    def _update_sums(self, total:int, sub_total:int, iva:int) -> None:
+        """Adds the given deltas to the running totals of the tickets.
+
+        Args:
+            total (int): Change of the Total sum in cents
+            sub_total (int): Change of the Sub-Total sum in cents
+            iva (int): Change of the IVA sum in cents
         """
-        self.summary = self.data.sum()
-        self.summary["ID"] = ""
-        self.summary["Ticket"] = "TOTAL"
-        self.summary["Total"] = round(self.summary["Total"], 2)
-        self.summary["Sub-Total"] = round(self.summary["Sub-Total"], 2)
-        self.summary["IVA"] = round(self.summary["IVA"], 2)
+        self._sum_total += int(total)
+        self._sum_sub_total += int(sub_total)
+        self._sum_iva += int(iva)
         
-    def save_record(self, record_name:str):
-        """Save the record into the database.
+    def verify_summary(self) -> bool:
+        """Consistency check of the running totals. Rescans the Total,
+        Sub-Total and IVA columns and resets the running totals to the
+        rescanned sums.
+
+        Returns:
+            bool: True if the running totals matched the rescanned sums
+        """
+        rows = self._rows()
+        sums = tuple(int(column[rows].sum()) for column in 
+                     (self._totals, self._sub_totals, self._ivas))
+        consistent = sums == self.summary_cents
+        self._sum_total, self._sum_sub_total, self._sum_iva = sums
+        return consistent
+        
+    def save_record(self, record_id:int):
+        """Save the tickets into the 'tickets' table of the database. If they
+        were fetched from (or last saved to) the same record, only the changes
+        made since then are written, otherwise the tickets of the record are
+        replaced. The uid of each ticket is stored as its position. Use 
+        'Records.save_record' to save the record summary in the same 
+        transaction. The search index of the ticket names ('tickets_search')
+        is updated in the same batch.
+        The tracked changes are kept until 'mark_saved' is called, which must
+        be done once the outermost transaction is committed, so a rolled back
+        save can be retried.
         
         Args:
-            record_name (str): Name of the record
+            record_id (int): ID of the record in the 'records' table
+        """
+        with self.db.transaction() as conn:
+            if record_id == self.record_id:
+                conn.executemany("DELETE FROM tickets WHERE record_id=? "\
+                                 "AND position=?",
+                                 ((record_id, uid) for uid in self._deleted))
+                conn.executemany("DELETE FROM tickets_search WHERE rowid=?",
+                                 (((record_id << 32) | uid,) for uid in self._deleted))
+                rows = np.concatenate((self._slots(list(self._edited)),
+                                       self._inserted_rows()))
+            else:
+                conn.execute("DELETE FROM tickets WHERE record_id=?", (record_id,))
+                conn.execute("DELETE FROM tickets_search WHERE rowid >= ? "\
+                             "AND rowid < ?",
+                             (record_id << 32, (record_id + 1) << 32))
+                rows = self._rows()
+            conn.executemany("INSERT INTO tickets(record_id, position, name, "\
+                             "total_cents, sub_total_cents, iva_cents) "\
+                             "VALUES (?,?,?,?,?,?) ON CONFLICT(record_id, "\
+                             "position) DO UPDATE SET name=excluded.name, "\
+                             "total_cents=excluded.total_cents, "\
+                             "sub_total_cents=excluded.sub_total_cents, "\
+                             "iva_cents=excluded.iva_cents",
+                             zip(repeat(record_id, len(rows)),
+                                 self._uids[rows].tolist(),
+                                 self._names[rows].tolist(),
+                                 self._totals[rows].tolist(),
+                                 self._sub_totals[rows].tolist(),
+                                 self._ivas[rows].tolist()))
+            conn.executemany("INSERT OR REPLACE INTO tickets_search(rowid, name) "\
+                             "VALUES (?,?)",
+                             zip(((record_id << 32) | self._uids[rows]).tolist(),
+                                 self._names[rows].tolist()))
+        
+    def _inserted_rows(self) -> np.ndarray:
+        """Array positions of the tickets added since the last fetch or save.
+        Their uids are the greatest ones, so they are at the end of the arrays.
+
+        Returns:
+            np.ndarray: Array positions of the inserted tickets
+        """
+        start = int(np.searchsorted(self._uids[:self._size], self._saved_uid))
+        return start + np.flatnonzero(self._alive[start:self._size])
+        
+    def mark_saved(self, record_id:int) -> None:
+        """Marks the current tickets as the saved state of the given record,
+        resetting the tracked changes.
+
+        Args:
+            record_id (int): ID of the record, None if there is no record
         """
-        conn = db.connect(self.db_file)
-        self.data.to_sql(record_name, conn, index=False, if_exists="replace")
-        conn.close()
+        self.record_id = record_id
+        self._saved_uid = self._next_uid
+        self._edited = set()
+        self._deleted = set()
         
     def clear_data(self) -> None:
         """
-        Remove all the rows in the 'data' Data Frame
+        Remove all the tickets, resetting the column arrays to their initial
+        capacity.
         """
-        self.data = self.data.drop(range(1,len(self.data)+1))
+        self._size = self._count = 0
+        self._next_uid = 1
+        self._uids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._alive = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._names = np.empty(INITIAL_CAPACITY, dtype=object)
+        self._totals = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._sub_totals = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._ivas = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._sum_total = self._sum_sub_total = self._sum_iva = 0
+        self._order = self._frame = None
+        self.mark_saved(None)
         
     def fetch_record(self, record_name:str) -> None:
-        """Fetch the record with the given name and assign it to the tickets
-        data (DataFrame) variable
+        """Fetch the tickets of the record with the given name and load them
+        into the tickets column arrays
 
         Args:
             record_name (str):  Name of the record
+
+        Raises:
+            ValueError: If the record doesn't exist
+        """
+        self.clear_data()
+        for chunk in self.stream_record(record_name):
+            self.load_chunk(chunk)
+        
+    def stream_record(self, record_name:str):
+        """Reads the tickets of the record with the given name from a cursor,
+        in chunks of rows (see 'fetchmany'). The first chunk is small so it
+        can be shown right away, the following ones double their size up to
+        MAX_CHUNK. It doesn't modify the tickets, so it can run on the
+        database thread while the chunks are loaded (see 'load_chunk') on the
+        GUI thread.
+
+        Args:
+            record_name (str): Name of the record
+
+        Yields:
+            tuple: ID of the record and the uids, names, totals, sub-totals
+                and IVA arrays of a chunk (amounts in cents). A record without
+                tickets yields a single empty chunk.
+
+        Raises:
+            ValueError: If the record doesn't exist (e.g. it was removed)
+        """
+        cur = self.db.execute("SELECT ID FROM records WHERE Name=?", (record_name,))
+        row = cur.fetchone()
+        if row is None:
+            raise ValueError(f"Record not found: {record_name}")
+        record_id = row[0]
+        cur = self.db.execute("SELECT position, name, total_cents, "\
+                              "sub_total_cents, iva_cents FROM tickets "\
+                              "WHERE record_id=? ORDER BY position", (record_id,))
+        size = FIRST_CHUNK
+        rows = cur.fetchmany(size)
+        if not rows:
+            yield (record_id, *(np.empty(0, dtype=dtype) for dtype in
+                                (np.int64, object, np.int64, np.int64, np.int64)))
+        while rows:
+            uids, names, totals, sub_totals, ivas = zip(*rows)
+            yield (record_id,
+                   np.array(uids, dtype=np.int64),
+                   np.array(names, dtype=object),
+                   np.array(totals, dtype=np.int64),
+                   np.array(sub_totals, dtype=np.int64),
+                   np.array(ivas, dtype=np.int64))
+            size = min(size * 2, MAX_CHUNK)
+            rows = cur.fetchmany(size)
+        
+    def load_chunk(self, chunk:tuple) -> None:
+        """Appends a chunk read by 'stream_record' to the tickets, which are
+        marked as the saved state of the record.
+
+        Args:
+            chunk (tuple): Record ID and column arrays of the chunk
         """
-        conn = db.connect(self.db_file)
-        self.data = pd.read_sql_query(f"SELECT * FROM '{record_name}'", conn)
-        self.data.index = self.data["ID"].values
-        conn.close()
\ No newline at end of file
+        record_id, uids, names, totals, sub_totals, ivas = chunk
+        self._append(names, totals, sub_totals, ivas, uids)
+        self.mark_saved(record_id)
@@ -0,0 +1,340 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from os import cpu_count
+from PySide6.QtCore import QObject, QThread, Signal, Slot
+from export import Export, ExportCancelled, export_record
+from tickets import Tickets
+
+
+class DatabaseWorker(QObject):
+    """
+    QObject which lives in the database thread and runs the requests sent to
+    it, one at a time. The requests are delivered through a queued signal, so
+    they wait in the event queue of the thread and run in the order they were
+    submitted. The storage classes get their own SQLite connection in this
+    thread (see 'Database.connection').
+    """
+    chunk = Signal(int, object)
+    finished = Signal(int, object)
+    failed = Signal(int, object)
+
+    @Slot(int, object, object, bool)
+    def run(self, request_id:int, function, args:tuple, stream:bool) -> None:
+        """Runs a request, emitting 'finished' with its result or 'failed'
+        with the raised exception. The items of a streamed request (the
+        function returns an iterator) are emitted one by one through 'chunk'
+        as they are produced.
+
+        Args:
+            request_id (int): ID of the request
+            function (Callable): Function to run
+            args (tuple): Arguments of the function
+            stream (bool): True if the request is streamed
+        """
+        try:
+            result = function(*args)
+            if stream:
+                for item in result:
+                    self.chunk.emit(request_id, item)
+                result = None
+        except Exception as error:
+            self.failed.emit(request_id, error)
+        else:
+            self.finished.emit(request_id, result)
+
+    @Slot()
+    def stop(self) -> None:
+        """
+        Stops the event loop of the database thread.
+        """
+        QThread.currentThread().quit()
+
+
+class DatabaseQueue(QObject):
+    """
+    Front of the database thread for the GUI thread. The storage calls are
+    submitted with a callback, which is called on the GUI thread once the
+    call is done, so the window never waits for SQLite. While there are
+    pending requests the queue is busy, 'busy_changed' is emitted with the
+    message of the oldest pending request when it changes. The exceptions of
+    the requests without an error callback are emitted through 'failed'.
+    """
+    busy_changed = Signal(bool, str)
+    failed = Signal(object)
+    _requested = Signal(int, object, object, bool)
+    _stopping = Signal()
+
+    def __init__(self, parent:QObject=None) -> None:
+        super().__init__(parent)
+        self._requests = {} # request ID -> (message, on_done, on_error, on_chunk)
+        self._next_id = 0
+        self._thread = QThread()
+        self._worker = DatabaseWorker()
+        self._worker.moveToThread(self._thread)
+        self._requested.connect(self._worker.run)
+        self._stopping.connect(self._worker.stop)
+        self._worker.chunk.connect(self._chunk)
+        self._worker.finished.connect(self._finished)
+        self._worker.failed.connect(self._failed)
+        self._thread.start()
+
+    @property
+    def busy(self) -> bool:
+        """True while there are pending requests.
+
+        Returns:
+            bool: Busy state
+        """
+        return bool(self._requests)
+
+    def submit(self, function, *args, message:str="", on_done=None,
+               on_error=None, on_chunk=None) -> int:
+        """Queues a call to run on the database thread.
+
+        Args:
+            function (Callable): Function to run, it must not touch widgets
+            *args: Arguments of the function
+            message (str, optional): Message shown while the request is
+                pending. Defaults to "".
+            on_done (Callable, optional): Called with the result of the
+                function. Defaults to None.
+            on_error (Callable, optional): Called with the raised exception.
+                Defaults to None (the exception is emitted by 'failed').
+            on_chunk (Callable, optional): Streams the request, the function
+                must return an iterator and this is called with each of its
+                items as soon as it's produced ('on_done' gets None).
+                Defaults to None.
+
+        Returns:
+            int: ID of the request
+        """
+        self._next_id += 1
+        self._requests[self._next_id] = (message, on_done, on_error, on_chunk)
+        if len(self._requests) == 1:
+            self.busy_changed.emit(True, message)
+        self._requested.emit(self._next_id, function, args, on_chunk is not None)
+        return self._next_id
+
+    def _chunk(self, request_id:int, item) -> None:
+        """Calls the chunk callback of a streamed request.
+
+        Args:
+            request_id (int): ID of the request
+            item (Any): Item produced by the request
+        """
+        self._requests[request_id][3](item)
+
+    def _finished(self, request_id:int, result) -> None:
+        """Calls the callback of a finished request.
+
+        Args:
+            request_id (int): ID of the request
+            result (Any): Result of the request
+        """
+        _, on_done, _, _ = self._pop(request_id)
+        if on_done is not None:
+            on_done(result)
+
+    def _failed(self, request_id:int, error:Exception) -> None:
+        """Calls the error callback of a failed request.
+
+        Args:
+            request_id (int): ID of the request
+            error (Exception): Exception raised by the request
+        """
+        _, _, on_error, _ = self._pop(request_id)
+        if on_error is not None:
+            on_error(error)
+        else:
+            self.failed.emit(error)
+
+    def _pop(self, request_id:int) -> tuple:
+        """Removes a request from the pending ones, updating the busy state.
+
+        Args:
+            request_id (int): ID of the request
+
+        Returns:
+            tuple: Message and callbacks of the request
+        """
+        request = self._requests.pop(request_id)
+        if self._requests:
+            message = next(iter(self._requests.values()))[0]
+            self.busy_changed.emit(True, message)
+        else:
+            self.busy_changed.emit(False, "")
+        return request
+
+    def stop(self) -> None:
+        """
+        Stops the database thread once the pending requests are done, waiting
+        for it.
+        """
+        self._stopping.emit()
+        self._thread.wait()
+
+
+class BatchExport(QObject):
+    """
+    Exports many saved records at once, each one into its own file, in a pool
+    of processes (see 'export.export_record'). Each process reads and writes
+    its records on its own, so the files are exported in parallel while the
+    window keeps running. The processes are spawned on every platform, so they
+    never inherit the connections or the threads of the window.
+    The result of each file is emitted through 'file_exported' on the GUI
+    thread as soon as it's done. Cancelling drops the files which didn't
+    start yet, the ones being written are finished.
+    """
+    file_exported = Signal(str, object) # Record name, exception or None
+    progress = Signal(int, int) # Done files, total files
+    finished = Signal(bool) # True if the export was cancelled
+    _done = Signal(str, object)
+
+    def __init__(self, parent:QObject=None) -> None:
+        super().__init__(parent)
+        self._pool = None
+        self._total = self._done_files = 0
+        self._cancelled = False
+        self._done.connect(self._file_done)
+
+    @property
+    def running(self) -> bool:
+        """True while there are files being exported.
+
+        Returns:
+            bool: Running state
+        """
+        return self._pool is not None
+
+    def start(self, record_names:list, file_type:str, path:str) -> None:
+        """Starts exporting the given records.
+
+        Args:
+            record_names (list): Names of the records
+            file_type (str): Type of the files (see 'export.FILE_TYPES')
+            path (str): Directory where the files will be saved
+
+        Raises:
+            RuntimeError: If an export is already running
+        """
+        if self.running:
+            raise RuntimeError("A batch export is already running")
+        self._total, self._done_files = len(record_names), 0
+        self._cancelled = False
+        if not record_names:
+            self.finished.emit(False)
+            return
+        self._pool = ProcessPoolExecutor(min(len(record_names), cpu_count() or 1),
+                                         mp_context=get_context("spawn"))
+        for record_name in record_names:
+            future = self._pool.submit(export_record, record_name, file_type, path)
+            # The callbacks run on the threads of the pool
+            future.add_done_callback(lambda future, record_name=record_name:
+                                         self._done.emit(record_name, future))
+
+    def _file_done(self, record_name:str, future:Future) -> None:
+        """Emits the result of a file and the progress of the export, which
+        finishes with the last file.
+
+        Args:
+            record_name (str): Name of the record
+            future (Future): Finished (or cancelled) export of the record
+        """
+        self._done_files += 1
+        if not future.cancelled():
+            self.file_exported.emit(record_name, future.exception())
+        self.progress.emit(self._done_files, self._total)
+        if self._done_files == self._total:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+            self.finished.emit(self._cancelled)
+
+    def cancel(self) -> None:
+        """
+        Cancels the files which didn't start yet, 'finished' is emitted once
+        the ones being written are done.
+        """
+        if self.running:
+            self._cancelled = True
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ExportJob(QObject):
+    """
+    Export of the tickets into a file (see 'Export.export') which runs on its
+    own thread, so the window keeps running while the file is written. The
+    job works on a snapshot of the tickets, taken when it's created, so the
+    tickets can be edited meanwhile. The progress is emitted through
+    'progress', and the end of the job through 'done', 'failed' or
+    'cancelled', always on the GUI thread. A failed or cancelled job leaves
+    the directory as it was.
+    """
+    progress = Signal(int, int) # Written tickets, total tickets
+    done = Signal(str) # Path of the exported file
+    failed = Signal(object)
+    cancelled = Signal()
+    finished = Signal()
+
+    def __init__(self, export:Export, tickets:Tickets, file_type:str,
+                 path:str, file_name:str) -> None:
+        super().__init__()
+        self.export = export
+        self.tickets = tickets.snapshot()
+        self.file_type = file_type
+        self.path = path
+        self.file_name = file_name
+        self._cancelled = False
+        self._thread = QThread()
+        self.moveToThread(self._thread)
+        self._thread.started.connect(self._run)
+        self._thread.finished.connect(self.finished)
+
+    def start(self) -> None:
+        """
+        Starts the export on the thread of the job.
+        """
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """
+        Stops the export at its next progress step.
+        """
+        self._cancelled = True
+
+    def wait(self) -> None:
+        """
+        Waits for the thread of the job to finish.
+        """
+        self._thread.wait()
+
+    def _progress(self, written:int, total:int) -> None:
+        """Emits the progress of the export, stopping it if it was cancelled.
+
+        Args:
+            written (int): Written tickets
+            total (int): Total tickets
+
+        Raises:
+            ExportCancelled: If the job was cancelled
+        """
+        if self._cancelled:
+            raise ExportCancelled()
+        self.progress.emit(written, total)
+
+    @Slot()
+    def _run(self) -> None:
+        """
+        Writes the file, emitting the result of the job, and stops its
+        thread.
+        """
+        try:
+            file = self.export.export(self.tickets, self.file_type, self.path,
+                                      self.file_name, self._progress)
+        except ExportCancelled:
+            self.cancelled.emit()
+        except Exception as error:
+            self.failed.emit(error)
+        else:
+            self.done.emit(file)
+        finally:
+            self._thread.quit()